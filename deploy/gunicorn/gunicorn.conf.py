@@ -1,4 +1,5 @@
 import multiprocessing
+import os
 
 bind = '127.0.0.1:8000'
 workers = multiprocessing.cpu_count() * 2 + 1
@@ -8,4 +9,11 @@ pidfile = '/run/gunicorn.pid'
 accesslog = '/home/logs/gunicorn/access.log'
 errorlog = '/home/logs/gunicorn/error.log'
 loglevel = 'info'
-timeout = 600
\ No newline at end of file
+timeout = 600
+
+
+def child_exit(server, worker):
+    # Удаляем файлы метрик Prometheus завершившегося воркера
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,6 +1,8 @@
 import os
 from celery import Celery
+from kombu import Queue
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
 from celery.utils.log import get_task_logger
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'irules_stats.settings')
@@ -14,9 +16,59 @@ app.autodiscover_tasks()
 # Настройки логирования
 logger = get_task_logger(__name__)
 
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    """Удаляем файлы метрик Prometheus завершившегося процесса воркера"""
+    from park.metrics import mark_process_dead
+    mark_process_dead(pid or os.getpid())
+
+
+# Очереди: текущая загрузка заказов и транзакций, справочники, дозагрузка истории.
+# Каждую очередь разбирает свой пул воркеров (deploy/supervisor), поэтому дозагрузка
+# и долгие справочники не задерживают текущую загрузку
+QUEUE_LIVE = 'live'
+QUEUE_REFERENCE = 'reference'
+QUEUE_BACKFILL = 'backfill'
+
+# приоритет внутри очереди: 0 - высший
+PRIORITY_LIVE = 0
+PRIORITY_REFERENCE = 5
+PRIORITY_BACKFILL = 9
+
+app.conf.task_queues = (
+    Queue(QUEUE_LIVE),
+    Queue(QUEUE_REFERENCE),
+    Queue(QUEUE_BACKFILL),
+    Queue('celery'),
+)
+app.conf.task_default_queue = 'celery'
+app.conf.task_default_priority = PRIORITY_REFERENCE
+app.conf.task_routes = {
+    'park.tasks.load_order_celery': {'queue': QUEUE_LIVE, 'priority': PRIORITY_LIVE},
+    'park.tasks.load_transactions_celery': {'queue': QUEUE_LIVE, 'priority': PRIORITY_LIVE},
+    'park.tasks.load_work_rules_celery': {'queue': QUEUE_REFERENCE, 'priority': PRIORITY_REFERENCE},
+    'park.tasks.load_yandex_driver_profiles_celery': {'queue': QUEUE_REFERENCE, 'priority': PRIORITY_REFERENCE},
+    'park.tasks.load_cars_celery': {'queue': QUEUE_REFERENCE, 'priority': PRIORITY_REFERENCE},
+    'park.tasks.drain_transactions_celery': {'queue': QUEUE_BACKFILL, 'priority': PRIORITY_BACKFILL},
+    'park.tasks.load_old_orders_celery': {'queue': QUEUE_BACKFILL, 'priority': PRIORITY_BACKFILL},
+    'park.tasks.backfill_unit_celery': {'queue': QUEUE_BACKFILL, 'priority': PRIORITY_BACKFILL},
+    'park.tasks.backfill_report_celery': {'queue': QUEUE_BACKFILL, 'priority': PRIORITY_BACKFILL},
+    'park.tasks.create_partitions_celery': {'queue': QUEUE_REFERENCE, 'priority': PRIORITY_REFERENCE},
+    'park.tasks.archive_old_data_celery': {'queue': QUEUE_BACKFILL, 'priority': PRIORITY_BACKFILL},
+    # задачи парков (load_park_celery, report_parks_celery) направляются в очередь своего загрузчика при запуске
+}
+
 app.conf.broker_transport_options = {
     'visibility_timeout': 1800,
+    # в Redis приоритеты эмулируются отдельными списками на каждый уровень
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
 }
+# задачи парков разной длительности: воркер берет следующую задачу только освободившись,
+# поэтому короткие задачи не ждут за длинными, зарезервированными тем же процессом
+app.conf.worker_prefetch_multiplier = 1
 
 # Исходный словарь
 beat_schedule = {
@@ -40,10 +92,18 @@ beat_schedule = {
         'task': 'park.tasks.load_transactions_celery',
         'schedule': crontab(minute='*/2')
     },
-    # 'Старые заказы': {
-    #     'task': 'park.tasks.load_old_orders_celery',
-    #     'schedule': crontab(minute=00, hour=00)
-    # },
+    'Разбор очереди транзакций': {
+        'task': 'park.tasks.drain_transactions_celery',
+        'schedule': crontab(minute='*/30')
+    },
+    'Создание секций заказов и транзакций': {
+        'task': 'park.tasks.create_partitions_celery',
+        'schedule': crontab(hour=3, minute=15)
+    },
+    'Архивация старых заказов и транзакций': {
+        'task': 'park.tasks.archive_old_data_celery',
+        'schedule': crontab(hour=4, minute=30)
+    },
 }
 
 app.conf.beat_schedule = beat_schedule
@@ -174,6 +174,15 @@ DATABASES = {
         'PORT': os.getenv('PORT'),
     }
 }
+# сколько строк за раз переносится из временной таблицы в основную при записи через COPY
+UPSERT_CHUNK_SIZE = int(os.getenv('UPSERT_CHUNK_SIZE', 5000))
+# на сколько месяцев вперед создаются секции заказов и транзакций
+PARTITIONS_MONTHS_AHEAD = int(os.getenv('PARTITIONS_MONTHS_AHEAD', 3))
+# архив старых заказов и транзакций: каталог файлов, через сколько дней месяц выгружается
+# из БД (считается от конца месяца) и сколько заказов выгружается и удаляется за раз
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', BASE_DIR / 'archive')
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 5000))
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -199,6 +208,62 @@ PYOTP_TOTP_NAME = 'iruler'
 INTEGRATOR_ID = os.getenv('INTEGRATOR_ID')
 INTEGRATOR_API_KEY = os.getenv('INTEGRATOR_API_KEY')
 
+# FLEET API
+# размер пула keep-alive соединений к fleet-api.taxi.yandex.net на процесс
+FLEET_API_POOL_SIZE = int(os.getenv('FLEET_API_POOL_SIZE', 32))
+# таймаут запроса, сек
+FLEET_API_TIMEOUT = int(os.getenv('FLEET_API_TIMEOUT', 60))
+# сколько парков загружается одновременно в одном запуске
+FLEET_API_PARKS_CONCURRENCY = int(os.getenv('FLEET_API_PARKS_CONCURRENCY', 8))
+# сколько страниц одного парка загружается одновременно (offset-пагинация)
+FLEET_API_PAGES_CONCURRENCY = int(os.getenv('FLEET_API_PAGES_CONCURRENCY', 4))
+# дробление периода заказов на подпериоды для загруженных парков
+if os.getenv('FLEET_API_ORDERS_SPLIT', default=True) in ['True', 'true', '1', True]:
+    FLEET_API_ORDERS_SPLIT = True
+else:
+    FLEET_API_ORDERS_SPLIT = False
+# не больше подпериодов на один запрос и не короче минимальной длительности, сек
+FLEET_API_ORDERS_MAX_WINDOWS = int(os.getenv('FLEET_API_ORDERS_MAX_WINDOWS', 48))
+FLEET_API_ORDERS_MIN_WINDOW = int(os.getenv('FLEET_API_ORDERS_MIN_WINDOW', 600))
+# предохранитель парка: после скольких ошибок ключа или сервера подряд парк отключается и на сколько, сек
+FLEET_API_BREAKER_THRESHOLD = int(os.getenv('FLEET_API_BREAKER_THRESHOLD', 5))
+FLEET_API_BREAKER_COOLDOWN = int(os.getenv('FLEET_API_BREAKER_COOLDOWN', 600))
+# кэш справочных эндпоинтов, сек
+FLEET_API_CACHE_TTL = {
+    'work_rules': int(os.getenv('FLEET_API_CACHE_TTL_WORK_RULES', 60 * 60 * 6)),
+    'transaction_categories': int(os.getenv('FLEET_API_CACHE_TTL_TRANSACTION_CATEGORIES', 60 * 60 * 24)),
+    'park_info': int(os.getenv('FLEET_API_CACHE_TTL_PARK_INFO', 60 * 60 * 24)),
+}
+# как долго неизменный справочник не перезаписывается в БД, сек
+FLEET_API_CACHE_APPLIED_TTL = int(os.getenv('FLEET_API_CACHE_APPLIED_TTL', 60 * 60 * 24))
+# как часто профили водителей загружаются полностью, а не только измененные, сек
+FLEET_API_PROFILES_FULL_SYNC_INTERVAL = int(os.getenv('FLEET_API_PROFILES_FULL_SYNC_INTERVAL', 60 * 60 * 24))
+# на сколько загрузка повторно захватывает период до отметки прошлой синхронизации, сек
+FLEET_API_SYNC_OVERLAP = int(os.getenv('FLEET_API_SYNC_OVERLAP', 60 * 10))
+# период первой загрузки заказов парка без отметки синхронизации, сек
+FLEET_API_ORDERS_INITIAL_WINDOW = int(os.getenv('FLEET_API_ORDERS_INITIAL_WINDOW', 60 * 60 * 2))
+# самый длинный догоняемый период заказов, сек (более ранние заказы загружаются дозагрузкой за даты)
+FLEET_API_ORDERS_MAX_GAP = int(os.getenv('FLEET_API_ORDERS_MAX_GAP', 60 * 60 * 24 * 3))
+# повторы дозагрузки парка за день после ошибки и задержка перед первым повтором, сек (дальше удваивается)
+BACKFILL_MAX_RETRIES = int(os.getenv('BACKFILL_MAX_RETRIES', 5))
+BACKFILL_RETRY_DELAY = int(os.getenv('BACKFILL_RETRY_DELAY', 60))
+# блокировка загрузки парка, сек: продлевается, пока загрузка идет, и истекает после падения воркера
+SYNC_LOCK_TTL = int(os.getenv('SYNC_LOCK_TTL', 60))
+# лимиты запросов на парк и эндпоинт, общие для всех воркеров: (размер корзины, токенов в секунду)
+FLEET_API_RATE_LIMITS = {
+    'default': (10, 5),
+    '/v1/parks/orders/list': (4, 1),
+    '/v2/parks/orders/transactions/list': (4, 1),
+    '/v1/parks/driver-profiles/list': (5, 2),
+    '/v1/parks/cars/list': (5, 2),
+}
+# сколько максимум ждать токен, сек (дальше запрос уходит без ожидания)
+FLEET_API_RATE_LIMIT_MAX_WAIT = int(os.getenv('FLEET_API_RATE_LIMIT_MAX_WAIT', 120))
+# сколько длится разбор очереди заказов на загрузку транзакций, сек
+FLEET_API_TRANSACTIONS_DRAIN_TIME_BUDGET = int(os.getenv('FLEET_API_TRANSACTIONS_DRAIN_TIME_BUDGET', 60 * 25))
+# токен Prometheus для /park/metrics/ (заголовок Authorization: Bearer <токен>), без токена метрики не отдаются
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 # НАСТРОЙКИ
 # количество цифр в одноразовом пароле для входа
 COUNT_CHARS_IN_PASSWORD = os.getenv('COUNT_CHARS_IN_PASSWORD')
@@ -211,6 +276,8 @@ REDIS_USERNAME = os.getenv('REDIS_USERNAME')
 REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
 
 REDIS_SERVER_0 = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
+# общие данные воркеров: лимиты запросов, кэш, блокировки
+REDIS_SERVER_1 = f'redis://{REDIS_HOST}:{REDIS_PORT}/1'
 
 
 # CELERY
@@ -1,4 +1,11 @@
+from datetime import datetime, timezone as dt_timezone
+
+import redis
 from django.contrib import admin
+from django.utils import timezone
+
+from park.breaker import STATE_CLOSED, STATE_NAMES, get_breaker, reset_breaker
+from park.cache import invalidate_park_cache
 from park.models import (
     Park,
     Car,
@@ -7,8 +14,14 @@ from park.models import (
     Driver,
     Order,
     Transaction,
-    DateProcessing
+    DateProcessing,
+    ParkSyncState,
+    BackfillUnit,
+    ArchiveMonth,
+    ParkDayStats,
+    DriverDayStats,
 )
+from park.views import count_park_orders
 
 admin.site.site_title = 'Iruler'
 admin.site.site_header = 'Iruler'
@@ -17,11 +30,44 @@ admin.site.site_header = 'Iruler'
 @admin.register(Park)
 class ParkAdmin(admin.ModelAdmin):
     save_on_top = True
-    list_display = ('name', 'city', 'park_id', 'is_active')
+    list_display = ('name', 'city', 'park_id', 'is_active', 'breaker_state', 'transactions_backlog')
     list_filter = ('is_active', 'city')
     search_fields = ('name', 'city', 'park_id')
     list_editable = ('is_active',)
     ordering = ('city', 'name')
+    readonly_fields = ('breaker_state',)
+    actions = ('reset_breakers', 'invalidate_cache')
+
+    def get_queryset(self, request):
+        # подзапрос на каждый парк идет по частичному индексу очереди загрузки транзакций
+        return super().get_queryset(request).annotate(
+            pending_orders_count=count_park_orders(load_transaction_complete=False)
+        )
+
+    @admin.display(description='заказов без транзакций', ordering='pending_orders_count')
+    def transactions_backlog(self, obj):
+        return obj.pending_orders_count
+
+    @admin.display(description='доступ к API')
+    def breaker_state(self, obj):
+        try:
+            state, failures, opened_at = get_breaker(obj.park_id)
+        except redis.RedisError:
+            return 'нет данных'
+        name = STATE_NAMES[state]
+        if state == STATE_CLOSED:
+            return f'{name} (ошибок подряд: {failures})' if failures else name
+        return f'{name} с {timezone.localtime(datetime.fromtimestamp(opened_at, dt_timezone.utc)):%d.%m.%Y %H:%M}, ошибок подряд: {failures}'
+
+    @admin.action(description='Включить запросы к API для выбранных парков')
+    def reset_breakers(self, request, queryset):
+        for park in queryset:
+            reset_breaker(park.park_id)
+
+    @admin.action(description='Сбросить кэш справочников для выбранных парков')
+    def invalidate_cache(self, request, queryset):
+        for park in queryset:
+            invalidate_park_cache(park.park_id, park.api_key, park.client_id)
 
 
 @admin.register(Car)
@@ -89,4 +135,55 @@ class DateProcessingAdmin(admin.ModelAdmin):
     list_filter = ('last_processed_date',)
     search_fields = ('last_processed_date',)
     readonly_fields = ('created_at', 'updated_at')
-    date_hierarchy = 'last_processed_date'
\ No newline at end of file
+    date_hierarchy = 'last_processed_date'
+
+
+@admin.register(ParkSyncState)
+class ParkSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('park', 'entity', 'watermark', 'full_sync_at', 'updated_at')
+    list_filter = ('entity',)
+    search_fields = ('park__name', 'park__park_id')
+    raw_id_fields = ('park',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(BackfillUnit)
+class BackfillUnitAdmin(admin.ModelAdmin):
+    list_display = ('park', 'date', 'status', 'attempts', 'orders_loaded', 'finished_at', 'error')
+    list_filter = ('status', 'date')
+    search_fields = ('park__name', 'park__park_id')
+    raw_id_fields = ('park',)
+    readonly_fields = ('started_at', 'finished_at', 'updated_at')
+    date_hierarchy = 'date'
+
+
+@admin.register(ArchiveMonth)
+class ArchiveMonthAdmin(admin.ModelAdmin):
+    list_display = ('park', 'month', 'orders_count', 'transactions_count', 'archived_at', 'restored_at')
+    list_filter = ('month',)
+    search_fields = ('park__name', 'park__park_id')
+    raw_id_fields = ('park',)
+    readonly_fields = ('orders_count', 'transactions_count', 'path', 'archived_at', 'restored_at')
+
+
+@admin.register(ParkDayStats)
+class ParkDayStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'park', 'day', 'orders_count', 'completed_count', 'cancelled_count', 'revenue', 'mileage',
+        'transactions_count', 'transactions_amount', 'updated_at'
+    )
+    list_filter = ('day',)
+    search_fields = ('park__name', 'park__park_id')
+    raw_id_fields = ('park',)
+    date_hierarchy = 'day'
+
+
+@admin.register(DriverDayStats)
+class DriverDayStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'driver', 'park', 'day', 'orders_count', 'completed_count', 'cancelled_count', 'revenue', 'mileage',
+        'transactions_count', 'transactions_amount', 'updated_at'
+    )
+    search_fields = ('driver__driver_id', 'driver__last_name', 'park__park_id')
+    raw_id_fields = ('park', 'driver')
+    date_hierarchy = 'day'
@@ -0,0 +1,235 @@
+import logging
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+import pytz
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from park.models import ArchiveMonth, Order, Transaction
+from park.partitions import ensure_partitions, get_month_bounds, get_month_start
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# сжатие файлов архива: zstd сжимает сильнее snappy (по умолчанию в pyarrow) при быстрой распаковке
+COMPRESSION = 'zstd'
+
+
+def check_pyarrow():
+    if pa is None:
+        raise RuntimeError('Для архива нужен pyarrow: pip install pyarrow')
+
+
+def get_arrow_type(field):
+    """Тип колонки Parquet для поля модели"""
+    if isinstance(field, models.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp('us', tz='UTC')
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if isinstance(field, models.FloatField):
+        return pa.float64()
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    if isinstance(field, (models.AutoField, models.IntegerField, models.ForeignKey)):
+        return pa.int64()
+    return pa.string()
+
+
+def get_schema(model):
+    """Схема файла архива: все колонки таблицы модели"""
+    return pa.schema([
+        pa.field(field.attname, get_arrow_type(field))
+        for field in model._meta.concrete_fields
+    ])
+
+
+def get_archive_path(park, month):
+    return Path(settings.ARCHIVE_DIR) / park.park_id / f'{month:%Y-%m}'
+
+
+def get_archive_months(park, cutoff):
+    """
+    Месяцы парка, целиком закончившиеся до cutoff, с заказами, транзакции которых загружены.
+    Месяцы, возвращенные из архива, автоматически не архивируются.
+    """
+    moscow = pytz.timezone('Europe/Moscow')
+    restored = set(
+        ArchiveMonth.objects.filter(park=park, restored_at__isnull=False).values_list('month', flat=True)
+    )
+    months = (
+        Order.objects.filter(park=park, created_at__lt=cutoff, load_transaction_complete=True)
+        .annotate(month=TruncMonth('created_at', tzinfo=moscow))
+        .order_by('month')
+        .values_list('month', flat=True)
+        .distinct()
+    )
+    return [
+        month.date() for month in months
+        if get_month_bounds(month.date())[1] <= cutoff and month.date() not in restored
+    ]
+
+
+def verify_file(path, ids):
+    """Файл читается и содержит ровно строки с ids"""
+    table = pq.read_table(path, columns=['id'])
+    if sorted(table.column('id').to_pylist()) != sorted(ids):
+        raise RuntimeError(f'Файл архива {path} не совпадает с БД: {table.num_rows} строк вместо {len(ids)}')
+
+
+def archive_park_month(park, month):
+    """
+    Выгрузка заказов парка за месяц (только с загруженными транзакциями) и их транзакций в файлы Parquet.
+    Строки удаляются из БД пакетами только после проверки записанных файлов.
+    Повторная архивация того же месяца дописывает новую часть архива.
+    Возвращает (заказов, транзакций).
+    """
+    check_pyarrow()
+    start, end = get_month_bounds(month)
+    orders = Order.objects.filter(
+        park=park, created_at__gte=start, created_at__lt=end, load_transaction_complete=True
+    ).order_by('pk')
+
+    path = get_archive_path(park, month)
+    path.mkdir(parents=True, exist_ok=True)
+    part = timezone.now().strftime('%Y%m%d%H%M%S')
+    files = {model: path / f'{model._meta.model_name}s-{part}.parquet' for model in (Order, Transaction)}
+    ids = {Order: [], Transaction: []}
+
+    # 1. выгрузка пакетами по первичному ключу во временные файлы
+    writers = {
+        model: pq.ParquetWriter(f'{file}.tmp', get_schema(model), compression=COMPRESSION)
+        for model, file in files.items()
+    }
+    try:
+        last_pk = 0
+        while True:
+            order_rows = list(orders.filter(pk__gt=last_pk).values()[:settings.ARCHIVE_BATCH_SIZE])
+            if not order_rows:
+                break
+            last_pk = order_rows[-1]['id']
+            order_ids = [row['id'] for row in order_rows]
+            transaction_rows = list(Transaction.objects.filter(order_id__in=order_ids).order_by('pk').values())
+
+            for model, rows in ((Order, order_rows), (Transaction, transaction_rows)):
+                if rows:
+                    writers[model].write_table(pa.Table.from_pylist(rows, schema=writers[model].schema))
+                    ids[model].extend(row['id'] for row in rows)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    if not ids[Order]:
+        for file in files.values():
+            os.remove(f'{file}.tmp')
+        return 0, 0
+
+    # 2. проверка файлов и перенос на постоянное место
+    try:
+        for model, file in files.items():
+            verify_file(f'{file}.tmp', ids[model])
+    except Exception:
+        for file in files.values():
+            os.remove(f'{file}.tmp')
+        raise
+    for file in files.values():
+        os.replace(f'{file}.tmp', file)
+
+    # 3. удаление из БД пакетами; транзакции удаляются вместе со своими заказами
+    order_ids = ids[Order]
+    for i in range(0, len(order_ids), settings.ARCHIVE_BATCH_SIZE):
+        batch = order_ids[i:i + settings.ARCHIVE_BATCH_SIZE]
+        with transaction.atomic():
+            Transaction.objects.filter(order_id__in=batch).delete()
+            Order.objects.filter(pk__in=batch, created_at__gte=start, created_at__lt=end).delete()
+
+    archive, _ = ArchiveMonth.objects.get_or_create(park=park, month=month, defaults={'path': str(path)})
+    ArchiveMonth.objects.filter(pk=archive.pk).update(
+        orders_count=F('orders_count') + len(ids[Order]),
+        transactions_count=F('transactions_count') + len(ids[Transaction]),
+        path=str(path),
+        archived_at=timezone.now(),
+        restored_at=None,
+    )
+    logger.info(
+        f'Архив {park} за {month:%Y-%m}: заказов {len(ids[Order])}, транзакций {len(ids[Transaction])}, {path}'
+    )
+    return len(ids[Order]), len(ids[Transaction])
+
+
+def archive_old_data(parks, after_days=None):
+    """
+    Архивация месяцев, закончившихся больше after_days (по умолчанию ARCHIVE_AFTER_DAYS) дней назад.
+    Ошибка месяца не останавливает остальные: месяц остается в БД до следующего запуска.
+    Возвращает (заказов, транзакций).
+    """
+    cutoff = timezone.now() - timedelta(days=after_days or settings.ARCHIVE_AFTER_DAYS)
+    orders_count = transactions_count = 0
+    for park in parks:
+        for month in get_archive_months(park, cutoff):
+            try:
+                orders, transactions = archive_park_month(park, month)
+            except Exception as e:
+                logger.error(f'Ошибка архивации {park} за {month:%Y-%m}: {e}')
+                continue
+            orders_count += orders
+            transactions_count += transactions
+    return orders_count, transactions_count
+
+
+def read_archive(park, month):
+    """Строки архива парка за месяц: {модель: [словари полей]}"""
+    check_pyarrow()
+    path = get_archive_path(park, month)
+    return {
+        model: [
+            row
+            for file in sorted(path.glob(f'{model._meta.model_name}s-*.parquet'))
+            for row in pq.read_table(file).to_pylist()
+        ]
+        for model in (Order, Transaction)
+    }
+
+
+def restore_park_month(park, month):
+    """
+    Возврат архива парка за месяц в БД с прежними id: транзакции продолжают ссылаться на свои заказы.
+    Строки, которые уже есть в БД, пропускаются. После возврата файлы удаляются, а месяц
+    больше не архивируется автоматически (только явным запуском архивации за этот месяц).
+    Возвращает (заказов, транзакций).
+    """
+    archive = ArchiveMonth.objects.get(park=park, month=get_month_start(month), restored_at__isnull=True)
+    rows = read_archive(park, archive.month)
+
+    # заказы пишутся в секцию своего месяца, транзакции - в секции месяцев event_at
+    last_event = max((row['event_at'] for row in rows[Transaction]), default=None)
+    ensure_partitions(archive.month, get_month_start(last_event) if last_event else archive.month)
+    with transaction.atomic():
+        for model, model_rows in rows.items():
+            model.objects.bulk_create(
+                [model(**row) for row in model_rows],
+                batch_size=settings.ARCHIVE_BATCH_SIZE,
+                ignore_conflicts=True
+            )
+        # дата архивации остается прежней
+        ArchiveMonth.objects.filter(pk=archive.pk).update(
+            orders_count=0, transactions_count=0, restored_at=timezone.now()
+        )
+    shutil.rmtree(get_archive_path(park, archive.month), ignore_errors=True)
+    logger.info(
+        f'Архив {park} за {archive.month:%Y-%m} возвращен: '
+        f'заказов {len(rows[Order])}, транзакций {len(rows[Transaction])}'
+    )
+    return len(rows[Order]), len(rows[Transaction])
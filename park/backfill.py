@@ -0,0 +1,85 @@
+import logging
+from datetime import datetime, time, timedelta
+
+import pytz
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from park.models import BackfillUnit
+from park.partitions import ensure_partitions
+from park.views import get_active_parks, load_park_orders
+
+logger = logging.getLogger(__name__)
+
+
+def get_day_window(day):
+    """Границы суток по московскому времени"""
+    moscow = pytz.timezone('Europe/Moscow')
+    day_start = moscow.localize(datetime.combine(day, time.min))
+    return day_start, moscow.localize(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def create_backfill_units(date_from, date_to, park_ids=None):
+    """
+    Разбиение дозагрузки на части (парк, день) с date_from по date_to включительно.
+    Уже загруженные части не меняются, остальные снова ставятся в очередь.
+    Возвращает id частей, которые нужно выполнить.
+    """
+    # заказы старых месяцев пишутся в свои секции, а не в секцию по умолчанию
+    ensure_partitions(date_from, date_to)
+
+    parks = list(get_active_parks(park_ids))
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    BackfillUnit.objects.bulk_create(
+        [BackfillUnit(park=park, date=day) for day in days for park in parks],
+        ignore_conflicts=True
+    )
+
+    units = BackfillUnit.objects.filter(park__in=parks, date__range=(date_from, date_to)).exclude(
+        status=BackfillUnit.STATUS_DONE
+    )
+    units.update(status=BackfillUnit.STATUS_PENDING, attempts=0, error='')
+    # дни чередуются по паркам, чтобы парк с долгими днями не занимал все воркеры
+    return list(units.order_by('date', 'park').values_list('pk', flat=True))
+
+
+def run_backfill_unit(unit_id):
+    """Загрузка заказов парка за день: отметка о выполнении ставится только после записи всех страниц"""
+    unit = BackfillUnit.objects.select_related('park').get(pk=unit_id)
+    if unit.status == BackfillUnit.STATUS_DONE:
+        return unit.status, unit.orders_loaded
+
+    unit.status = BackfillUnit.STATUS_RUNNING
+    unit.attempts += 1
+    unit.started_at = timezone.now()
+    unit.save(update_fields=['status', 'attempts', 'started_at', 'updated_at'])
+
+    try:
+        written, skipped = load_park_orders(unit.park, *get_day_window(unit.date))
+    except Exception as e:
+        unit.status = BackfillUnit.STATUS_FAILED
+        unit.error = str(e)[:1000]
+        unit.save(update_fields=['status', 'error', 'updated_at'])
+        logger.error(f'{unit.park} Ошибка дозагрузки заказов за {unit.date} (попытка {unit.attempts}): {e}')
+        raise
+
+    unit.status = BackfillUnit.STATUS_DONE
+    unit.orders_loaded = written + skipped
+    unit.error = ''
+    unit.finished_at = timezone.now()
+    unit.save(update_fields=['status', 'orders_loaded', 'error', 'finished_at', 'updated_at'])
+    return unit.status, unit.orders_loaded
+
+
+def get_backfill_progress(date_from, date_to, park_ids=None):
+    """Ход дозагрузки: {статус: число частей}, всего частей и загружено заказов"""
+    units = BackfillUnit.objects.filter(
+        park__in=get_active_parks(park_ids),
+        date__range=(date_from, date_to)
+    )
+    statuses = dict(units.order_by().values_list('status').annotate(Count('pk')))
+    return {
+        'statuses': {status: statuses.get(status, 0) for status, _ in BackfillUnit.STATUS_CHOICES},
+        'total': sum(statuses.values()),
+        'orders': units.aggregate(orders=Sum('orders_loaded'))['orders'] or 0,
+    }
@@ -0,0 +1,97 @@
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from park.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+STATE_NAMES = {
+    STATE_CLOSED: 'работает',
+    STATE_OPEN: 'отключен',
+    STATE_HALF_OPEN: 'пробный запрос',
+}
+
+
+class CircuitOpenError(Exception):
+    """Запросы по парку временно отключены после серии ошибок"""
+
+
+def get_breaker_key(park_id):
+    return f'fleet_api:breaker:{park_id}'
+
+
+def get_probe_key(park_id):
+    return f'fleet_api:breaker:{park_id}:probe'
+
+
+def get_breaker(park_id):
+    """Состояние предохранителя парка: (состояние, число ошибок подряд, время отключения)"""
+    data = get_redis().hgetall(get_breaker_key(park_id))
+    failures = int(data.get(b'failures', 0))
+    opened_at = float(data[b'opened_at']) if b'opened_at' in data else None
+
+    if opened_at is None:
+        return STATE_CLOSED, failures, None
+    if time.time() - opened_at < settings.FLEET_API_BREAKER_COOLDOWN:
+        return STATE_OPEN, failures, opened_at
+    return STATE_HALF_OPEN, failures, opened_at
+
+
+def check_circuit(park_id):
+    """
+    Проверка перед запросом. Для отключенного парка выбрасывает CircuitOpenError,
+    после паузы пропускает один пробный запрос. Возвращает текущее состояние.
+    При недоступности Redis запрос не блокируется.
+    """
+    try:
+        state, failures, _ = get_breaker(park_id)
+        if state == STATE_OPEN:
+            raise CircuitOpenError(f'Запросы по парку {park_id} отключены')
+        if state == STATE_HALF_OPEN:
+            # Пробный запрос выполняет только один воркер, блокировка истекает, если он не ответил
+            acquired = get_redis().set(
+                get_probe_key(park_id), 1, nx=True, ex=settings.FLEET_API_TIMEOUT * 2
+            )
+            if not acquired:
+                raise CircuitOpenError(f'По парку {park_id} уже выполняется пробный запрос')
+        return state, failures
+    except redis.RedisError as e:
+        logger.error(f'Предохранитель недоступен: {e} {park_id}')
+        return STATE_CLOSED, 0
+
+
+def record_success(park_id):
+    """Успешный ответ: предохранитель снова замкнут"""
+    try:
+        get_redis().delete(get_breaker_key(park_id), get_probe_key(park_id))
+    except redis.RedisError as e:
+        logger.error(f'Предохранитель недоступен: {e} {park_id}')
+
+
+def record_failure(park_id, state):
+    """Ошибка ключа или сервера: после FLEET_API_BREAKER_THRESHOLD ошибок подряд или неудачной пробы парк отключается"""
+    key = get_breaker_key(park_id)
+    try:
+        client = get_redis()
+        failures = client.hincrby(key, 'failures', 1)
+        if state == STATE_HALF_OPEN or failures >= settings.FLEET_API_BREAKER_THRESHOLD:
+            client.hset(key, 'opened_at', time.time())
+            client.delete(get_probe_key(park_id))
+            logger.error(
+                f'Запросы по парку {park_id} отключены на {settings.FLEET_API_BREAKER_COOLDOWN} сек '
+                f'после {failures} ошибок подряд'
+            )
+    except redis.RedisError as e:
+        logger.error(f'Предохранитель недоступен: {e} {park_id}')
+
+
+def reset_breaker(park_id):
+    """Ручное включение парка"""
+    record_success(park_id)
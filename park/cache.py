@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+
+import redis
+from django.conf import settings
+
+from park.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Справочные эндпоинты, ответы которых кэшируются
+CACHE_WORK_RULES = 'work_rules'
+CACHE_TRANSACTION_CATEGORIES = 'transaction_categories'
+CACHE_PARK_INFO = 'park_info'
+
+
+def get_cache_key(name, key):
+    return f'fleet_api:cache:{name}:{key}'
+
+
+def get_applied_key(name, key):
+    return f'fleet_api:applied:{name}:{key}'
+
+
+def get_park_info_key(park_id, api_key, client_id):
+    """Ключ информации о парке: при смене ключей API кэш не используется"""
+    return hashlib.sha1(f'{park_id}:{api_key}:{client_id}'.encode()).hexdigest()
+
+
+def get_content_hash(data):
+    """Хеш содержимого ответа, не зависящий от порядка ключей"""
+    content = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def get_cached(name, key, fetch):
+    """
+    Ответ справочного эндпоинта из кэша, а при его отсутствии - fetch() с сохранением на
+    FLEET_API_CACHE_TTL[name] секунд. Возвращает (данные, хеш содержимого), пустые ответы не кэшируются.
+    """
+    cache_key = get_cache_key(name, key)
+    try:
+        data, content_hash = get_redis().hmget(cache_key, 'data', 'hash')
+        if data is not None and content_hash is not None:
+            return json.loads(data), content_hash.decode()
+    except redis.RedisError as e:
+        logger.error(f'Кэш недоступен: {e} {name} {key}')
+
+    data = fetch()
+    if not isinstance(data, dict):
+        return data, None
+
+    content_hash = get_content_hash(data)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hset(cache_key, mapping={'data': json.dumps(data, ensure_ascii=False), 'hash': content_hash})
+        pipe.expire(cache_key, settings.FLEET_API_CACHE_TTL[name])
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f'Кэш недоступен: {e} {name} {key}')
+    return data, content_hash
+
+
+def is_applied(name, key, content_hash):
+    """Содержимое с этим хешем уже записано в БД"""
+    if content_hash is None:
+        return False
+    try:
+        applied = get_redis().get(get_applied_key(name, key))
+    except redis.RedisError as e:
+        logger.error(f'Кэш недоступен: {e} {name} {key}')
+        return False
+    return applied is not None and applied.decode() == content_hash
+
+
+def mark_applied(name, key, content_hash):
+    """Запомнить хеш записанного в БД содержимого (раз в FLEET_API_CACHE_APPLIED_TTL запись повторяется)"""
+    if content_hash is None:
+        return
+    try:
+        get_redis().set(get_applied_key(name, key), content_hash, ex=settings.FLEET_API_CACHE_APPLIED_TTL)
+    except redis.RedisError as e:
+        logger.error(f'Кэш недоступен: {e} {name} {key}')
+
+
+def invalidate_cache(name, key):
+    """Сбросить кэш ответа и отметку о записи, следующая загрузка пойдет в API и в БД"""
+    try:
+        get_redis().delete(get_cache_key(name, key), get_applied_key(name, key))
+    except redis.RedisError as e:
+        logger.error(f'Кэш недоступен: {e} {name} {key}')
+
+
+def invalidate_park_cache(park_id, api_key, client_id):
+    """Сбросить кэш всех справочников парка"""
+    invalidate_cache(CACHE_WORK_RULES, park_id)
+    invalidate_cache(CACHE_TRANSACTION_CATEGORIES, park_id)
+    invalidate_cache(CACHE_PARK_INFO, get_park_info_key(park_id, api_key, client_id))
@@ -0,0 +1,106 @@
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+from park.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Снять или продлить блокировку может только ее владелец: после истечения TTL
+# блокировку мог взять другой воркер, и ее нельзя удалять по одному ключу
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_scripts = {}
+
+
+def get_lock_key(name):
+    return f'sync:lock:{name}'
+
+
+def run_script(source, keys, args):
+    client = get_redis()
+    if source not in _scripts:
+        _scripts[source] = client.register_script(source)
+    return _scripts[source](keys=keys, args=args, client=client)
+
+
+def acquire_lock(name, ttl):
+    """
+    Взять блокировку на ttl секунд: возвращает токен владельца или None, если блокировка занята.
+    При недоступности Redis возвращает пустой токен - загрузка не блокируется.
+    """
+    token = uuid.uuid4().hex
+    try:
+        if get_redis().set(get_lock_key(name), token, nx=True, ex=ttl):
+            return token
+        return None
+    except redis.RedisError as e:
+        logger.error(f'Блокировки недоступны: {e} {name}')
+        return ''
+
+
+def extend_lock(name, token, ttl):
+    """Продлить свою блокировку: False, если она истекла и занята другим"""
+    if not token:
+        return True
+    try:
+        return bool(run_script(EXTEND_SCRIPT, [get_lock_key(name)], [token, ttl]))
+    except redis.RedisError as e:
+        logger.error(f'Блокировки недоступны: {e} {name}')
+        return True
+
+
+def release_lock(name, token):
+    """Снять свою блокировку"""
+    if not token:
+        return
+    try:
+        run_script(RELEASE_SCRIPT, [get_lock_key(name)], [token])
+    except redis.RedisError as e:
+        logger.error(f'Блокировки недоступны: {e} {name}')
+
+
+@contextmanager
+def hold_lock(name, ttl=None):
+    """
+    Блокировка на время выполнения: отдает True, если получена, или False, если ее держит другой запуск.
+    Пока блок выполняется, блокировка продлевается каждые ttl / 3 секунд, поэтому долгая загрузка
+    ее не теряет, а после падения воркера она освобождается через ttl секунд.
+    """
+    ttl = ttl or settings.SYNC_LOCK_TTL
+    token = acquire_lock(name, ttl)
+    if token is None:
+        yield False
+        return
+
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(ttl / 3):
+            if not extend_lock(name, token, ttl):
+                logger.error(f'Блокировка {name} потеряна до окончания загрузки')
+                return
+
+    thread = threading.Thread(target=heartbeat, name=f'lock-heartbeat-{name}', daemon=True)
+    thread.start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        thread.join()
+        release_lock(name, token)
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from park.archive import archive_old_data, archive_park_month
+from park.models import ArchiveMonth, Park
+from park.views import get_active_parks
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise CommandError(f'Месяц должен быть в формате ГГГГ-ММ: {value}')
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка старых заказов и транзакций в файлы архива и удаление их из БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--park', action='append', dest='park_ids', help='park_id, можно несколько раз')
+        parser.add_argument('--after-days', type=int, help='архивировать месяцы, закончившиеся больше N дней назад')
+        parser.add_argument('--month', help='архивировать только этот месяц парка, ГГГГ-ММ (вместе с --park)')
+        parser.add_argument('--list', action='store_true', help='только показать архивированные месяцы')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            archives = ArchiveMonth.objects.select_related('park')
+            if options['park_ids']:
+                archives = archives.filter(park__park_id__in=options['park_ids'])
+            for archive in archives:
+                restored = f', возвращен {archive.restored_at:%Y-%m-%d}' if archive.restored_at else ''
+                self.stdout.write(
+                    f'{archive.park.park_id} {archive.month:%Y-%m}: заказов {archive.orders_count}, '
+                    f'транзакций {archive.transactions_count}{restored}'
+                )
+            return
+
+        if options['month']:
+            if not options['park_ids'] or len(options['park_ids']) != 1:
+                raise CommandError('Для --month нужен ровно один --park')
+            park = Park.objects.filter(park_id=options['park_ids'][0]).first()
+            if park is None:
+                raise CommandError(f'Парк не найден: {options["park_ids"][0]}')
+            orders, transactions = archive_park_month(park, parse_month(options['month']))
+        else:
+            orders, transactions = archive_old_data(get_active_parks(options['park_ids']), options['after_days'])
+        self.stdout.write(f'В архив выгружено заказов {orders}, транзакций {transactions}')
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from park.backfill import create_backfill_units, get_backfill_progress, run_backfill_unit
+from park.models import BackfillUnit
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Дата должна быть в формате ГГГГ-ММ-ДД: {value}')
+
+
+class Command(BaseCommand):
+    help = 'Дозагрузка заказов за период по частям (парк, день) и ход дозагрузки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('date_from', help='первый день, ГГГГ-ММ-ДД')
+        parser.add_argument('date_to', help='последний день включительно, ГГГГ-ММ-ДД')
+        parser.add_argument('--park', action='append', dest='park_ids', help='park_id, можно несколько раз')
+        parser.add_argument('--progress', action='store_true', help='только показать ход дозагрузки')
+        parser.add_argument('--inline', action='store_true', help='выполнить в этом процессе, без Celery')
+
+    def handle(self, *args, **options):
+        date_from = parse_date(options['date_from'])
+        date_to = parse_date(options['date_to'])
+        if date_from > date_to:
+            raise CommandError('Первый день позже последнего')
+        park_ids = options['park_ids']
+
+        if options['progress']:
+            self.write_progress(date_from, date_to, park_ids)
+            return
+
+        if options['inline']:
+            for unit_id in create_backfill_units(date_from, date_to, park_ids):
+                try:
+                    run_backfill_unit(unit_id)
+                except Exception as e:
+                    self.stderr.write(f'{BackfillUnit.objects.get(pk=unit_id)}: {e}')
+            self.write_progress(date_from, date_to, park_ids)
+            return
+
+        from park.tasks import load_old_orders_celery
+        load_old_orders_celery.delay(str(date_from), str(date_to), park_ids)
+        self.stdout.write(f'Дозагрузка {date_from} - {date_to} поставлена в очередь')
+
+    def write_progress(self, date_from, date_to, park_ids):
+        progress = get_backfill_progress(date_from, date_to, park_ids)
+        names = dict(BackfillUnit.STATUS_CHOICES)
+        statuses = ', '.join(f'{names[status]} {count}' for status, count in progress['statuses'].items())
+        done = progress['statuses'][BackfillUnit.STATUS_DONE]
+        percent = done * 100 // progress['total'] if progress['total'] else 0
+        self.stdout.write(f'Готово {percent}%, частей {progress["total"]}: {statuses}; заказов {progress["orders"]}')
@@ -0,0 +1,105 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from park.parsers import parse_orders_page, parse_transactions_page
+
+
+def make_orders_page(count):
+    """Синтетическая страница /v1/parks/orders/list, близкая к реальному ответу"""
+    orders = []
+    for i in range(count):
+        orders.append({
+            'id': f'{i:032x}',
+            'short_id': i,
+            'status': 'complete',
+            'created_at': '2025-08-01T10:00:00+03:00',
+            'booked_at': '2025-08-01T10:00:00+03:00',
+            'ended_at': '2025-08-01T10:30:00+03:00',
+            'provider': 'platform',
+            'category': 'econom',
+            'payment_method': 'cash',
+            'price': '523.0000',
+            'mileage': '8345.1000',
+            'driver_profile': {'id': f'd{i % 300:031x}', 'name': 'Иванов Иван Иванович'},
+            'car': {'id': f'c{i % 200:031x}', 'brand_model': 'Kia Rio', 'license': {'number': 'А123АА777'}},
+            'address_from': {'address': 'Москва, Тверская улица, 1', 'lat': 55.757, 'lon': 37.615},
+            'route_points': [
+                {'address': 'Москва, Арбат, 10', 'lat': 55.751, 'lon': 37.594},
+                {'address': 'Москва, Ленинский проспект, 30', 'lat': 55.708, 'lon': 37.585},
+            ],
+            'events': [
+                {'event_at': '2025-08-01T10:00:00+03:00', 'order_status': 'driving'},
+                {'event_at': '2025-08-01T10:05:00+03:00', 'order_status': 'waiting'},
+                {'event_at': '2025-08-01T10:10:00+03:00', 'order_status': 'transporting'},
+            ],
+            'cancellation_description': '',
+        })
+    return json.dumps({'orders': orders, 'cursor': 'next', 'limit': count}, ensure_ascii=False).encode()
+
+
+def make_transactions_page(count):
+    """Синтетическая страница /v2/parks/orders/transactions/list"""
+    transactions = []
+    for i in range(count):
+        transactions.append({
+            'id': f'{i:032x}',
+            'order_id': f'{i // 3:032x}',
+            'event_at': '2025-08-01T10:30:00+03:00',
+            'category_id': 'partner_service_recurring_payment',
+            'category_name': 'Периодические списания',
+            'group_id': 'partner_fees',
+            'amount': '-150.0000',
+            'currency_code': 'RUB',
+            'description': 'Списание по условиям работы',
+            'created_by': {'identity': 'platform'},
+            'driver_profile_id': f'd{i % 300:031x}',
+        })
+    return json.dumps({'transactions': transactions, 'cursor': 'next'}, ensure_ascii=False).encode()
+
+
+def dict_path(content, key):
+    """Прежний путь: response.json() для данных, курсора и условия цикла"""
+    items = json.loads(content).get(key, [])
+    cursor = json.loads(content).get('cursor')
+    json.loads(content).get('cursor')
+    return items, cursor
+
+
+def measure(func, content, repeat):
+    """Процессорное время и пиковая память на разбор страницы"""
+    tracemalloc.start()
+    result = func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    started = time.process_time()
+    for _ in range(repeat):
+        func(content)
+    cpu = (time.process_time() - started) / repeat
+    return cpu, peak
+
+
+class Command(BaseCommand):
+    help = 'Сравнение разбора страниц Fleet API: словари против типизированных записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=500, help='записей на странице')
+        parser.add_argument('--repeat', type=int, default=20, help='повторов для замера времени')
+
+    def handle(self, *args, **options):
+        size = options['size']
+        repeat = options['repeat']
+
+        cases = [
+            ('orders', make_orders_page(size), parse_orders_page),
+            ('transactions', make_transactions_page(size), parse_transactions_page),
+        ]
+        for key, content, parse in cases:
+            self.stdout.write(f'{key}: {size} записей, {len(content) / 1024:.0f} КБ')
+            for name, func in (('dict', lambda c: dict_path(c, key)), ('records', parse)):
+                cpu, peak = measure(func, content, repeat)
+                self.stdout.write(f'  {name:8} cpu {cpu * 1000:8.2f} мс   peak {peak / 1024:8.0f} КБ')
@@ -0,0 +1,119 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from park.models import Driver, Order, Park, Transaction
+from park.upsert import upsert
+
+
+class Rollback(Exception):
+    """Отмена записанных замером данных"""
+
+
+def make_orders(park, driver, count, price):
+    """Синтетические заказы парка"""
+    created_at = timezone.now() - timedelta(days=1)
+    return [
+        Order(
+            park=park,
+            driver=driver,
+            order_id=f'bench{i:027x}',
+            short_id=str(i),
+            created_at=created_at,
+            status='complete',
+            category='econom',
+            payment_method='cash',
+            price=price,
+            address_from='Москва, Тверская улица, 1',
+            address_from_lat=55.757,
+            address_from_lon=37.615,
+            address_to='Москва, Арбат, 10',
+            address_to_lat=55.751,
+            address_to_lon=37.594,
+            mileage=Decimal('8345.1'),
+        )
+        for i in range(count)
+    ]
+
+
+def make_transactions(park, driver, orders, amount):
+    """Синтетические транзакции: по две на заказ"""
+    event_at = timezone.now() - timedelta(days=1)
+    return [
+        Transaction(
+            park=park,
+            driver=driver,
+            order_id=order.pk,
+            transaction_id=f'{order.order_id}{n}',
+            event_at=event_at,
+            category_id='partner_service_recurring_payment',
+            category_name='Периодические списания',
+            group_id='partner_fees',
+            amount=amount,
+            description='Списание по условиям работы',
+        )
+        for order in orders
+        for n in range(2)
+    ]
+
+
+def bulk_create_path(model, objs, unique_fields, update_fields):
+    """Прежний путь: bulk_create пакетами по 100"""
+    model.objects.bulk_create(
+        objs,
+        batch_size=100,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=update_fields
+    )
+
+
+def measure(write, model, objs, unique_fields, update_fields):
+    """Время записи и число запросов к БД"""
+    queries = len(connection.queries)
+    started = time.perf_counter()
+    write(model, objs, unique_fields, update_fields)
+    return time.perf_counter() - started, len(connection.queries) - queries
+
+
+class Command(BaseCommand):
+    help = 'Сравнение записи заказов и транзакций: bulk_create против COPY во временную таблицу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=20000, help='заказов в замере')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Замер имеет смысл только на PostgreSQL')
+
+        size = options['size']
+        connection.force_debug_cursor = True
+        for name, write in (('bulk_create', bulk_create_path), ('copy', upsert)):
+            try:
+                # все записанное замером откатывается
+                with transaction.atomic():
+                    # bulk_create не вызывает Park.save, запрашивающий данные парка в API
+                    park = Park.objects.bulk_create([Park(park_id='bench', api_key='', client_id='')])[0]
+                    driver = Driver.objects.create(park=park, driver_id='bench', last_name='Иванов')
+                    self.stdout.write(f'{name}:')
+                    for step, price in (('вставка', Decimal(100)), ('обновление', Decimal(200))):
+                        orders = make_orders(park, driver, size, price)
+                        seconds, queries = measure(
+                            write, Order, orders, ['created_at', 'order_id'], ['status', 'price', 'short_id', 'category', 'mileage']
+                        )
+                        self.stdout.write(f'  {"заказы":10} {step:10} {seconds:8.2f} сек  {queries:6} запросов')
+
+                        orders = Order.objects.filter(park=park).only('pk', 'order_id')
+                        transactions = make_transactions(park, driver, orders, price)
+                        seconds, queries = measure(
+                            write, Transaction, transactions, ['event_at', 'transaction_id'], ['amount', 'group_id']
+                        )
+                        self.stdout.write(f'  {"транзакции":10} {step:10} {seconds:8.2f} сек  {queries:6} запросов')
+                    raise Rollback
+            except Rollback:
+                pass
+        connection.force_debug_cursor = False
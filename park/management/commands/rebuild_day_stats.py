@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from park.rollups import refresh_day_stats
+from park.views import get_active_parks
+
+
+def parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Дата должна быть в формате ГГГГ-ММ-ДД: {value}')
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет итогов парков и водителей по дням за период (первичное заполнение, исправление)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('date_from', help='первый день, ГГГГ-ММ-ДД')
+        parser.add_argument('date_to', help='последний день, ГГГГ-ММ-ДД')
+        parser.add_argument('--park', action='append', dest='park_ids', help='park_id, можно несколько раз')
+
+    def handle(self, *args, **options):
+        date_from, date_to = parse_day(options['date_from']), parse_day(options['date_to'])
+        if date_from > date_to:
+            raise CommandError('date_from позже date_to')
+
+        for park in get_active_parks(options['park_ids']):
+            # дни месяцев, выгруженных в архив, не пересчитываются: их заказов нет в БД
+            days = refresh_day_stats(park, date_from, date_to)
+            self.stdout.write(f'{park.park_id}: пересчитано дней {days}')
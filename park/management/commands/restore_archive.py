@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from park.archive import read_archive, restore_park_month
+from park.management.commands.archive_old_data import parse_month
+from park.models import ArchiveMonth, Park, Order, Transaction
+
+
+class Command(BaseCommand):
+    help = 'Возврат архива заказов и транзакций парка за месяц в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('park_id', help='park_id парка')
+        parser.add_argument('month', help='месяц, ГГГГ-ММ')
+        parser.add_argument('--dry-run', action='store_true', help='только прочитать архив и показать число строк')
+
+    def handle(self, *args, **options):
+        park = Park.objects.filter(park_id=options['park_id']).first()
+        if park is None:
+            raise CommandError(f'Парк не найден: {options["park_id"]}')
+        month = parse_month(options['month'])
+        if not ArchiveMonth.objects.filter(park=park, month=month, restored_at__isnull=True).exists():
+            raise CommandError(f'Архива {park.park_id} за {month:%Y-%m} нет')
+
+        if options['dry_run']:
+            rows = read_archive(park, month)
+            self.stdout.write(f'В архиве заказов {len(rows[Order])}, транзакций {len(rows[Transaction])}')
+            return
+
+        orders, transactions = restore_park_month(park, month)
+        self.stdout.write(f'Возвращено заказов {orders}, транзакций {transactions}')
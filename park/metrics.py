@@ -0,0 +1,129 @@
+import os
+import time
+from functools import wraps
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Если задан PROMETHEUS_MULTIPROC_DIR, метрики процессов gunicorn и celery пишутся в общий каталог
+# и собираются вместе при запросе /park/metrics/
+
+API_REQUEST_SECONDS = Histogram(
+    'fleet_api_request_seconds',
+    'Длительность запроса к Fleet API',
+    ['endpoint', 'park'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+API_RESPONSES = Counter(
+    'fleet_api_responses_total',
+    'Ответы Fleet API по коду',
+    ['endpoint', 'status'],
+)
+API_RATE_LIMITED = Counter(
+    'fleet_api_rate_limited_total',
+    'Ответы 429 от Fleet API',
+    ['endpoint', 'park'],
+)
+API_RETRIES = Counter(
+    'fleet_api_retries_total',
+    'Повторные запросы после ошибки 429',
+    ['endpoint', 'park'],
+)
+API_PAGES = Counter(
+    'fleet_api_pages_total',
+    'Загруженные страницы списков',
+    ['endpoint', 'park'],
+)
+LOADER_SECONDS = Histogram(
+    'loader_duration_seconds',
+    'Длительность загрузки',
+    ['loader'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+LOADER_ERRORS = Counter(
+    'loader_errors_total',
+    'Загрузки, завершившиеся исключением',
+    ['loader'],
+)
+ROWS_UPSERTED = Counter(
+    'loader_rows_upserted_total',
+    'Строки, отправленные в БД загрузчиками',
+    ['model'],
+)
+ROWS_SKIPPED = Counter(
+    'loader_rows_skipped_total',
+    'Строки, не отправленные в БД: данные не изменились',
+    ['model'],
+)
+SYNC_RUNS_SKIPPED = Counter(
+    'sync_runs_skipped_total',
+    'Запуски загрузки, пропущенные: предыдущий запуск еще выполняется',
+    ['task'],
+)
+TRANSACTIONS_BACKLOG = Gauge(
+    'loader_transactions_backlog',
+    'Заказы, транзакции которых еще не загружены',
+    ['park'],
+    multiprocess_mode='mostrecent',
+)
+
+
+def observe_api_response(url_path, park_id, status_code, seconds):
+    """Учет ответа Fleet API"""
+    API_REQUEST_SECONDS.labels(url_path, park_id).observe(seconds)
+    API_RESPONSES.labels(url_path, str(status_code)).inc()
+    if status_code == 429:
+        API_RATE_LIMITED.labels(url_path, park_id).inc()
+
+
+def track_loader(func):
+    """Длительность и ошибки загрузчика"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            LOADER_ERRORS.labels(func.__name__).inc()
+            raise
+        finally:
+            LOADER_SECONDS.labels(func.__name__).observe(time.monotonic() - started)
+    return wrapper
+
+
+def count_upserted(model, rows, skipped=0):
+    """Учет записанных строк и строк, пропущенных без изменений"""
+    if rows:
+        ROWS_UPSERTED.labels(model.__name__).inc(len(rows))
+    if skipped:
+        ROWS_SKIPPED.labels(model.__name__).inc(skipped)
+
+
+def observe_transactions_backlog(backlog):
+    """Размер очереди заказов на загрузку транзакций: {park_id: число}"""
+    for park_id, count in backlog.items():
+        TRANSACTIONS_BACKLOG.labels(park_id).set(count)
+
+
+def get_metrics():
+    """Метрики в формате Prometheus: (тело, content-type)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Удаление файлов метрик завершившегося процесса (gunicorn child_exit, celery worker_process_shutdown)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park', '0015_alter_transaction_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParkSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('drivers', 'водители')], max_length=32, verbose_name='вид данных')),
+                ('watermark', models.DateTimeField(blank=True, default=None, null=True, verbose_name='загружено по')),
+                ('full_sync_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='последняя полная загрузка')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='дата обновления')),
+                ('park', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_states', to='park.park', verbose_name='парк')),
+            ],
+            options={
+                'verbose_name': 'состояние синхронизации',
+                'verbose_name_plural': 'состояния синхронизации',
+                'ordering': ['park', 'entity'],
+                'unique_together': {('park', 'entity')},
+            },
+        ),
+    ]
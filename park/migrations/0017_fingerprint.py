@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park', '0016_parksyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='хеш загруженных данных'),
+        ),
+        migrations.AddField(
+            model_name='driver',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='хеш загруженных данных'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='хеш загруженных данных'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='хеш загруженных данных'),
+        ),
+    ]
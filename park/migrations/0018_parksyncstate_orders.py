@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park', '0017_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parksyncstate',
+            name='entity',
+            field=models.CharField(choices=[('drivers', 'водители'), ('orders', 'заказы')], max_length=32, verbose_name='вид данных'),
+        ),
+    ]
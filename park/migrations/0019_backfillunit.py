@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park', '0018_parksyncstate_orders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='дата')),
+                ('status', models.CharField(choices=[('pending', 'в очереди'), ('running', 'выполняется'), ('done', 'загружено'), ('failed', 'ошибка')], default='pending', max_length=16, verbose_name='статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='попыток')),
+                ('orders_loaded', models.PositiveIntegerField(default=0, verbose_name='загружено заказов')),
+                ('error', models.CharField(blank=True, default='', max_length=1000, verbose_name='ошибка')),
+                ('started_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='начало')),
+                ('finished_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='окончание')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='дата обновления')),
+                ('park', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backfill_units', to='park.park', verbose_name='парк')),
+            ],
+            options={
+                'verbose_name': 'дозагрузка за день',
+                'verbose_name_plural': 'дозагрузка за дни',
+                'ordering': ['date', 'park'],
+                'unique_together': {('park', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,260 @@
+from django.db import migrations, models, transaction
+
+# Строковые колонки переводятся в типизированные без долгой блокировки таблиц:
+# новая колонка рядом со старой, триггер для строк, которые пишутся во время миграции,
+# заполнение пакетами по первичному ключу (каждый пакет в своей транзакции)
+# и короткая транзакция замены старой колонки новой.
+
+BATCH_SIZE = 10000
+LOCK_TIMEOUT = '5s'
+
+# {таблица: [(колонка, тип, функция разбора, значение для нераспознанных или None, прежний тип)]}
+COLUMNS = {
+    'park_account': [
+        ('balance', 'numeric(15, 4)', 'park_try_numeric', '0', 'varchar(255)'),
+        ('balance_limit', 'numeric(15, 4)', 'park_try_numeric', '0', 'varchar(255)'),
+    ],
+    'park_driver': [
+        ('created_date', 'date', 'park_try_date', None, 'varchar(255)'),
+        ('driver_license_issue_date', 'date', 'park_try_date', None, 'varchar(255)'),
+        ('driver_license_expiration_date', 'date', 'park_try_date', None, 'varchar(255)'),
+    ],
+    'park_order': [
+        ('address_from_lat', 'double precision', 'park_try_float', None, 'varchar(50)'),
+        ('address_from_lon', 'double precision', 'park_try_float', None, 'varchar(50)'),
+        ('address_to_lat', 'double precision', 'park_try_float', None, 'varchar(50)'),
+        ('address_to_lon', 'double precision', 'park_try_float', None, 'varchar(50)'),
+        ('mileage', 'numeric(15, 4)', 'park_try_numeric', '0', 'varchar(255)'),
+    ],
+}
+
+# прежние колонки, которые были NOT NULL
+NOT_NULL_BEFORE = {
+    ('park_account', 'balance'),
+    ('park_account', 'balance_limit'),
+    ('park_driver', 'created_date'),
+    ('park_order', 'address_from_lat'),
+    ('park_order', 'address_from_lon'),
+    ('park_order', 'address_to_lat'),
+    ('park_order', 'address_to_lon'),
+    ('park_order', 'mileage'),
+}
+
+# некорректные значения (пустые строки, мусор, выход за numeric(15, 4)) становятся NULL
+FUNCTIONS_SQL = """
+CREATE OR REPLACE FUNCTION park_try_numeric(value text) RETURNS numeric(15, 4) AS $$
+BEGIN
+    RETURN nullif(btrim(value), '')::numeric(15, 4);
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION park_try_float(value text) RETURNS double precision AS $$
+BEGIN
+    RETURN nullif(btrim(value), '')::double precision;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION park_try_date(value text) RETURNS date AS $$
+BEGIN
+    -- '2020-01-31' и '2020-01-31T00:00:00+0000'
+    RETURN left(nullif(btrim(value), ''), 10)::date;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+"""
+
+DROP_FUNCTIONS_SQL = """
+DROP FUNCTION IF EXISTS park_try_numeric(text);
+DROP FUNCTION IF EXISTS park_try_float(text);
+DROP FUNCTION IF EXISTS park_try_date(text);
+"""
+
+
+def get_typed_column(column):
+    return f'{column}_typed'
+
+
+def get_convert_expression(column, parse, default, source=''):
+    expression = f'{parse}({source}{column}::text)'
+    if default is not None:
+        expression = f'coalesce({expression}, {default})'
+    return expression
+
+
+def execute(cursor, sql):
+    with transaction.atomic():
+        cursor.execute(sql)
+
+
+def convert_table(cursor, table, columns):
+    """Перевод колонок одной таблицы"""
+    trigger = f'{table}_typed_sync'
+
+    # 1. новые колонки без значения по умолчанию: таблица не перезаписывается
+    execute(cursor, f'ALTER TABLE {table} ' + ', '.join(
+        f'ADD COLUMN IF NOT EXISTS {get_typed_column(column)} {column_type}'
+        for column, column_type, _, _, _ in columns
+    ))
+
+    # 2. строки, которые пишутся во время миграции, получают типизированные значения сразу
+    assignments = '\n'.join(
+        f'    NEW.{get_typed_column(column)} := {get_convert_expression(column, parse, default, "NEW.")};'
+        for column, _, parse, default, _ in columns
+    )
+    execute(cursor, f"""
+        CREATE OR REPLACE FUNCTION {trigger}() RETURNS trigger AS $$
+        BEGIN
+        {assignments}
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS {trigger} ON {table};
+        CREATE TRIGGER {trigger} BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {trigger}();
+    """)
+
+    # 3. существующие строки пакетами, каждый пакет - отдельная короткая транзакция
+    cursor.execute(f'SELECT min(id), max(id) FROM {table}')
+    min_id, max_id = cursor.fetchone()
+    if min_id is not None:
+        assignments = ', '.join(
+            f'{get_typed_column(column)} = {get_convert_expression(column, parse, default)}'
+            for column, _, parse, default, _ in columns
+        )
+        for start in range(min_id, max_id + 1, BATCH_SIZE):
+            execute(cursor, f'UPDATE {table} SET {assignments} WHERE id >= {start} AND id < {start + BATCH_SIZE}')
+
+    # 4. NOT NULL через проверенное ограничение: проверка идет без блокировки записи,
+    # а SET NOT NULL использует ее и не сканирует таблицу
+    for column, _, _, default, _ in columns:
+        if default is None:
+            continue
+        typed = get_typed_column(column)
+        check = f'{table}_{typed}_not_null'
+        execute(
+            cursor,
+            f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}, '
+            f'ADD CONSTRAINT {check} CHECK ({typed} IS NOT NULL) NOT VALID'
+        )
+        execute(cursor, f'ALTER TABLE {table} VALIDATE CONSTRAINT {check}')
+
+    # 5. замена колонок одной короткой транзакцией
+    with transaction.atomic():
+        cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        cursor.execute(f'DROP TRIGGER {trigger} ON {table}')
+        cursor.execute(f'DROP FUNCTION {trigger}()')
+        for column, _, _, default, _ in columns:
+            typed = get_typed_column(column)
+            cursor.execute(f'ALTER TABLE {table} DROP COLUMN {column}')
+            cursor.execute(f'ALTER TABLE {table} RENAME COLUMN {typed} TO {column}')
+            if default is not None:
+                cursor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL')
+                cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {table}_{typed}_not_null')
+
+
+def convert_columns(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        execute(cursor, FUNCTIONS_SQL)
+        for table, columns in COLUMNS.items():
+            convert_table(cursor, table, columns)
+        execute(cursor, DROP_FUNCTIONS_SQL)
+
+
+def revert_columns(apps, schema_editor):
+    """Возврат строковых колонок: блокирующий ALTER TYPE, только для отката"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor, transaction.atomic():
+        for table, columns in COLUMNS.items():
+            for column, _, _, _, old_type in columns:
+                if (table, column) in NOT_NULL_BEFORE:
+                    cursor.execute(
+                        f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {old_type} "
+                        f"USING coalesce({column}::text, '')"
+                    )
+                    cursor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL')
+                else:
+                    cursor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE {old_type} USING {column}::text')
+
+
+class AlterFieldOnline(migrations.AlterField):
+    """AlterField, который в PostgreSQL не трогает таблицу: колонки переводит convert_columns"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # пакеты заполнения коммитятся по отдельности
+    atomic = False
+
+    dependencies = [
+        ('park', '0019_backfillunit'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_columns, revert_columns),
+        AlterFieldOnline(
+            model_name='account',
+            name='balance',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='баланс'),
+        ),
+        AlterFieldOnline(
+            model_name='account',
+            name='balance_limit',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='ограничение баланса'),
+        ),
+        AlterFieldOnline(
+            model_name='driver',
+            name='created_date',
+            field=models.DateField(blank=True, default=None, null=True, verbose_name='дата создания'),
+        ),
+        AlterFieldOnline(
+            model_name='driver',
+            name='driver_license_expiration_date',
+            field=models.DateField(blank=True, default=None, null=True, verbose_name='дата окончания ВУ'),
+        ),
+        AlterFieldOnline(
+            model_name='driver',
+            name='driver_license_issue_date',
+            field=models.DateField(blank=True, default=None, null=True, verbose_name='дата выдачи ВУ'),
+        ),
+        AlterFieldOnline(
+            model_name='order',
+            name='address_from_lat',
+            field=models.FloatField(blank=True, default=None, null=True, verbose_name='адрес откуда широта'),
+        ),
+        AlterFieldOnline(
+            model_name='order',
+            name='address_from_lon',
+            field=models.FloatField(blank=True, default=None, null=True, verbose_name='адрес откуда долгота'),
+        ),
+        AlterFieldOnline(
+            model_name='order',
+            name='address_to_lat',
+            field=models.FloatField(blank=True, default=None, null=True, verbose_name='адрес куда широта'),
+        ),
+        AlterFieldOnline(
+            model_name='order',
+            name='address_to_lon',
+            field=models.FloatField(blank=True, default=None, null=True, verbose_name='адрес куда долгота'),
+        ),
+        AlterFieldOnline(
+            model_name='order',
+            name='mileage',
+            field=models.DecimalField(blank=True, decimal_places=4, default=0, max_digits=15, verbose_name='пробег'),
+        ),
+    ]
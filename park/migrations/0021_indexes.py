@@ -0,0 +1,69 @@
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class PostgresOnly:
+    """Индексы строятся только в PostgreSQL без блокировки записи, в остальных базах меняется только состояние"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class AddIndexOnline(PostgresOnly, AddIndexConcurrently):
+    pass
+
+
+class RemoveIndexOnline(PostgresOnly, RemoveIndexConcurrently):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY не выполняется в транзакции
+    atomic = False
+
+    dependencies = [
+        ('park', '0020_typed_columns'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='order',
+            index=models.Index(condition=models.Q(('load_transaction_complete', False)), fields=['park', 'id'], name='order_pending_park_idx'),
+        ),
+        AddIndexOnline(
+            model_name='order',
+            index=models.Index(fields=['park', 'created_at'], name='order_park_created_idx'),
+        ),
+        AddIndexOnline(
+            model_name='order',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='order_created_brin'),
+        ),
+        AddIndexOnline(
+            model_name='transaction',
+            index=models.Index(fields=['driver', 'event_at'], name='transaction_driver_event_idx'),
+        ),
+        AddIndexOnline(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['event_at'], name='transaction_event_brin'),
+        ),
+        # повторяют индексы уникальных ограничений на тех же полях
+        RemoveIndexOnline(
+            model_name='driver',
+            name='park_driver_driver__331b7b_idx',
+        ),
+        RemoveIndexOnline(
+            model_name='order',
+            name='park_order_order_i_bec9d3_idx',
+        ),
+        RemoveIndexOnline(
+            model_name='transaction',
+            name='park_transa_transac_bd44cf_idx',
+        ),
+    ]
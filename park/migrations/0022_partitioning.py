@@ -0,0 +1,193 @@
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models, transaction
+from django.utils import timezone
+
+from park.partitions import add_months, create_partition, get_month_start, iter_months
+
+# Таблицы заказов и транзакций переводятся на месячные секции без остановки загрузки:
+# рядом создается секционированная таблица, триггер повторяет в ней все изменения старой,
+# существующие строки копируются пакетами по первичному ключу, затем короткая транзакция
+# удаляет старую таблицу и переименовывает новую.
+
+BATCH_SIZE = 10000
+LOCK_TIMEOUT = '5s'
+
+# (таблица, колонка секций, уникальная колонка, уникальное ограничение);
+# транзакции переводятся первыми: старая таблица транзакций ссылается на старую таблицу заказов
+TABLES = [
+    ('park_transaction', 'event_at', 'transaction_id', 'transaction_id_event_uniq'),
+    ('park_order', 'created_at', 'order_id', 'order_order_id_created_uniq'),
+]
+
+
+def execute(cursor, sql, params=None):
+    with transaction.atomic():
+        cursor.execute(sql, params)
+
+
+def get_indexes(cursor, table):
+    """Неуникальные индексы таблицы, кроме индексов LIKE для уникальной колонки: {имя: определение}"""
+    cursor.execute(
+        """
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass AND NOT x.indisunique AND right(i.relname, 5) <> '_like'
+        """,
+        [table]
+    )
+    return dict(cursor.fetchall())
+
+
+def partition_table(cursor, table, column, unique_column, unique_name):
+    """Перевод одной таблицы на месячные секции"""
+    new = f'{table}_partitioned'
+    sync = f'{table}_partition_sync'
+
+    # после прерванной миграции перевод начинается заново
+    execute(cursor, f'DROP TRIGGER IF EXISTS {sync} ON {table}; DROP TABLE IF EXISTS {new}')
+
+    # 1. секционированная таблица с ключами, включающими колонку секций
+    execute(cursor, f"""
+        CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS INCLUDING IDENTITY) PARTITION BY RANGE ({column});
+        ALTER TABLE {new} ADD CONSTRAINT {new}_pkey PRIMARY KEY (id, {column});
+        ALTER TABLE {new} ADD CONSTRAINT {unique_name}_p UNIQUE ({unique_column}, {column});
+    """)
+
+    # 2. внешние ключи, кроме ссылок на секционированные таблицы, и индексы старой таблицы
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f' AND confrelid::regclass::text <> ALL(%s)
+        """,
+        [table, [name for name, _, _, _ in TABLES]]
+    )
+    for name, definition in cursor.fetchall():
+        execute(cursor, f'ALTER TABLE {new} ADD CONSTRAINT {name} {definition}')
+    indexes = get_indexes(cursor, table)
+    for name, definition in indexes.items():
+        execute(cursor, re.sub(r'^CREATE INDEX \S+ ON \S+ ', f'CREATE INDEX {name}_p ON {new} ', definition))
+
+    # 3. секции: с месяца самой старой строки и на PARTITIONS_MONTHS_AHEAD месяцев вперед,
+    # строки вне секций попадают в секцию по умолчанию
+    execute(cursor, f'CREATE TABLE {table}_default PARTITION OF {new} DEFAULT')
+    cursor.execute(f'SELECT min({column}) FROM {table}')
+    first = cursor.fetchone()[0] or timezone.now()
+    last = add_months(get_month_start(timezone.localdate()), settings.PARTITIONS_MONTHS_AHEAD)
+    for month in iter_months(get_month_start(first), last):
+        create_partition(cursor, table, column, month, parent=new)
+
+    # 4. изменения старой таблицы во время копирования повторяются в новой
+    execute(cursor, f"""
+        CREATE OR REPLACE FUNCTION {sync}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM {new} WHERE id = OLD.id AND {column} = OLD.{column};
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO {new} VALUES (NEW.*);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE TRIGGER {sync} AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {sync}();
+    """)
+
+    # 5. существующие строки пакетами; FOR SHARE не дает изменить строку, пока ее пакет не записан,
+    # а строки, уже перенесенные триггером, пропускаются
+    cursor.execute(f'SELECT min(id), max(id) FROM {table}')
+    min_id, max_id = cursor.fetchone()
+    if min_id is not None:
+        for start in range(min_id, max_id + 1, BATCH_SIZE):
+            execute(
+                cursor,
+                f'INSERT INTO {new} SELECT * FROM {table} WHERE id >= {start} AND id < {start + BATCH_SIZE} '
+                f'FOR SHARE ON CONFLICT DO NOTHING'
+            )
+
+    # 6. замена таблицы одной короткой транзакцией
+    with transaction.atomic():
+        cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'SELECT (SELECT count(*) FROM {table}), (SELECT count(*) FROM {new})')
+        old_count, new_count = cursor.fetchone()
+        if old_count != new_count:
+            raise RuntimeError(f'{table}: в секционированной таблице {new_count} строк вместо {old_count}')
+
+        cursor.execute(f'DROP TABLE {table}')
+        cursor.execute(f'DROP FUNCTION {sync}()')
+        cursor.execute(f'ALTER TABLE {new} RENAME TO {table}')
+        cursor.execute(f'ALTER TABLE {table} RENAME CONSTRAINT {new}_pkey TO {table}_pkey')
+        cursor.execute(f'ALTER TABLE {table} RENAME CONSTRAINT {unique_name}_p TO {unique_name}')
+        for name in indexes:
+            cursor.execute(f'ALTER INDEX {name}_p RENAME TO {name}')
+        cursor.execute(f'ALTER SEQUENCE {new}_id_seq RENAME TO {table}_id_seq')
+        cursor.execute(f"SELECT setval('{table}_id_seq', coalesce(max(id), 0) + 1, false) FROM {table}")
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, column, unique_column, unique_name in TABLES:
+            partition_table(cursor, table, column, unique_column, unique_name)
+
+
+class StateOnPostgres:
+    """В PostgreSQL таблицы перестраивает partition_tables, операция меняет только состояние"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class AlterField(StateOnPostgres, migrations.AlterField):
+    pass
+
+
+class AddConstraint(StateOnPostgres, migrations.AddConstraint):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    # пакеты копирования коммитятся по отдельности
+    atomic = False
+
+    dependencies = [
+        ('park', '0021_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables),
+        AlterField(
+            model_name='order',
+            name='order_id',
+            field=models.CharField(max_length=255, verbose_name='id заказа'),
+        ),
+        AlterField(
+            model_name='transaction',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='transaction_order', to='park.order', verbose_name='заказ'),
+        ),
+        AlterField(
+            model_name='transaction',
+            name='transaction_id',
+            field=models.CharField(max_length=255, verbose_name='id заказа'),
+        ),
+        AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('order_id', 'created_at'), name='order_order_id_created_uniq'),
+        ),
+        AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('transaction_id', 'event_at'), name='transaction_id_event_uniq'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park', '0022_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='месяц')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='заказов')),
+                ('transactions_count', models.PositiveIntegerField(default=0, verbose_name='транзакций')),
+                ('path', models.CharField(max_length=500, verbose_name='каталог архива')),
+                ('archived_at', models.DateTimeField(auto_now=True, verbose_name='дата архивации')),
+                ('restored_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='возвращен в БД')),
+                ('park', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_months', to='park.park', verbose_name='парк')),
+            ],
+            options={
+                'verbose_name': 'архив за месяц',
+                'verbose_name_plural': 'архив за месяцы',
+                'ordering': ['month', 'park'],
+                'unique_together': {('park', 'month')},
+            },
+        ),
+    ]
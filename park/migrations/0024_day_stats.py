@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park', '0023_archivemonth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverDayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='заказов')),
+                ('completed_count', models.PositiveIntegerField(default=0, verbose_name='выполнено')),
+                ('cancelled_count', models.PositiveIntegerField(default=0, verbose_name='отменено')),
+                ('revenue', models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='выручка')),
+                ('mileage', models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='пробег')),
+                ('transactions_count', models.PositiveIntegerField(default=0, verbose_name='транзакций')),
+                ('transactions_amount', models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='сумма транзакций')),
+                ('transactions_by_category', models.JSONField(blank=True, default=dict, verbose_name='транзакции по категориям')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='дата обновления')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_stats', to='park.driver', verbose_name='водитель')),
+                ('park', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='driver_day_stats', to='park.park', verbose_name='парк')),
+            ],
+            options={
+                'verbose_name': 'итоги водителя за день',
+                'verbose_name_plural': 'итоги водителей за дни',
+                'ordering': ['-day', 'driver'],
+                'indexes': [models.Index(fields=['park', 'day'], name='driverdaystats_park_day_idx')],
+                'unique_together': {('driver', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ParkDayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='заказов')),
+                ('completed_count', models.PositiveIntegerField(default=0, verbose_name='выполнено')),
+                ('cancelled_count', models.PositiveIntegerField(default=0, verbose_name='отменено')),
+                ('revenue', models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='выручка')),
+                ('mileage', models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='пробег')),
+                ('transactions_count', models.PositiveIntegerField(default=0, verbose_name='транзакций')),
+                ('transactions_amount', models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='сумма транзакций')),
+                ('transactions_by_category', models.JSONField(blank=True, default=dict, verbose_name='транзакции по категориям')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='дата обновления')),
+                ('park', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_stats', to='park.park', verbose_name='парк')),
+            ],
+            options={
+                'verbose_name': 'итоги парка за день',
+                'verbose_name_plural': 'итоги парков за дни',
+                'ordering': ['-day', 'park'],
+                'unique_together': {('park', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('park', '0024_day_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivemonth',
+            name='archived_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='дата архивации'),
+        ),
+    ]
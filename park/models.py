@@ -1,3 +1,4 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
 
@@ -68,6 +69,7 @@ class Car(models.Model):
     amenities = models.CharField(max_length=1500, verbose_name='удобства', blank=True)
     category = models.CharField(max_length=1500, verbose_name='категория ТС', blank=True)
     registration_cert = models.CharField(max_length=255, verbose_name='свидетельство о регистрации')
+    fingerprint = models.CharField(max_length=40, verbose_name='хеш загруженных данных', blank=True, default='')
 
     class Meta:
         verbose_name = 'автомобиль'
@@ -98,8 +100,8 @@ class DriverWorkRule(models.Model):
 class Account(models.Model):
     """Счет водителя"""
     account_id = models.CharField(max_length=32, verbose_name='id аккаунта', unique=True, db_index=True)
-    balance = models.CharField(max_length=255, verbose_name='баланс', default=0)
-    balance_limit = models.CharField(max_length=255, verbose_name='ограничение баланса', default=0,)
+    balance = models.DecimalField(decimal_places=4, max_digits=15, verbose_name='баланс', default=0)
+    balance_limit = models.DecimalField(decimal_places=4, max_digits=15, verbose_name='ограничение баланса', default=0)
     currency = models.CharField(max_length=255, verbose_name='валюта',)
     account_type = models.CharField(max_length=255, verbose_name='тип счета',)
 
@@ -126,15 +128,13 @@ class Driver(models.Model):
     middle_name = models.CharField(max_length=255, verbose_name='отчество', blank=True)
     driver_license_number = models.CharField(max_length=255, verbose_name='номер ВУ', blank=True)
     driver_license_country = models.CharField(max_length=255, verbose_name='страна ВУ', blank=True,)
-    driver_license_issue_date = models.CharField(
-        max_length=255,
+    driver_license_issue_date = models.DateField(
         verbose_name='дата выдачи ВУ',
         blank=True,
         null=True,
         default=None
     )
-    driver_license_expiration_date = models.CharField(
-        max_length=255,
+    driver_license_expiration_date = models.DateField(
         verbose_name='дата окончания ВУ',
         blank=True,
         null=True,
@@ -158,12 +158,10 @@ class Driver(models.Model):
         null=True,
         default=None
     )
-    created_date = models.CharField(max_length=255, verbose_name='дата создания', blank=True)
+    created_date = models.DateField(verbose_name='дата создания', blank=True, null=True, default=None)
+    fingerprint = models.CharField(max_length=40, verbose_name='хеш загруженных данных', blank=True, default='')
 
     class Meta:
-        indexes = [
-            models.Index(fields=['driver_id'])
-        ]
         unique_together = ('park', 'driver_id')
         verbose_name = 'водитель'
         verbose_name_plural = 'водители'
@@ -191,7 +189,7 @@ class Order(models.Model):
         null=True,
         default=None
     )
-    order_id = models.CharField(max_length=255, verbose_name='id заказа', unique=True, db_index=True)
+    order_id = models.CharField(max_length=255, verbose_name='id заказа')
     short_id = models.CharField(max_length=255, verbose_name='короткий id заказа')
     created_at = models.DateTimeField(verbose_name='создан')
     status = models.CharField(max_length=255, verbose_name='статус заказа', blank=True, default='')
@@ -199,12 +197,12 @@ class Order(models.Model):
     payment_method = models.CharField(max_length=255, verbose_name='способ оплаты', blank=True, default='')
     price = models.DecimalField(decimal_places=4, max_digits=15, verbose_name='стоимость')
     address_from = models.CharField(max_length=500, verbose_name='адрес откуда', blank=True, default='')
-    address_from_lat = models.CharField(max_length=50, verbose_name='адрес откуда широта', blank=True, default='')
-    address_from_lon = models.CharField(max_length=50, verbose_name='адрес откуда долгота', blank=True, default='')
+    address_from_lat = models.FloatField(verbose_name='адрес откуда широта', blank=True, null=True, default=None)
+    address_from_lon = models.FloatField(verbose_name='адрес откуда долгота', blank=True, null=True, default=None)
     address_to = models.CharField(max_length=500, verbose_name='адрес куда', blank=True, default='')
-    address_to_lat = models.CharField(max_length=50, verbose_name='адрес куда широта', blank=True, default='')
-    address_to_lon = models.CharField(max_length=50, verbose_name='адрес куда долгота', blank=True, default='')
-    mileage = models.CharField(max_length=255, verbose_name='пробег', blank=True, default=0)
+    address_to_lat = models.FloatField(verbose_name='адрес куда широта', blank=True, null=True, default=None)
+    address_to_lon = models.FloatField(verbose_name='адрес куда долгота', blank=True, null=True, default=None)
+    mileage = models.DecimalField(decimal_places=4, max_digits=15, verbose_name='пробег', blank=True, default=0)
     car = models.ForeignKey(
         Car,
         on_delete=models.PROTECT,
@@ -215,10 +213,24 @@ class Order(models.Model):
     )
     cancellation_description = models.CharField(max_length=255, verbose_name='описание отмены', blank=True, default='')
     load_transaction_complete = models.BooleanField(verbose_name='загрузка транзакций завершена', default=False)
+    fingerprint = models.CharField(max_length=40, verbose_name='хеш загруженных данных', blank=True, default='')
 
     class Meta:
         indexes = [
-            models.Index(fields=['order_id'])
+            # очередь загрузки транзакций: только заказы, по которым загрузка не завершена
+            models.Index(
+                fields=['park', 'id'],
+                condition=models.Q(load_transaction_complete=False),
+                name='order_pending_park_idx',
+            ),
+            # заказы парка за период
+            models.Index(fields=['park', 'created_at'], name='order_park_created_idx'),
+            # заказы всех парков за период: строки пишутся по порядку времени, поэтому хватает компактного BRIN
+            BrinIndex(fields=['created_at'], name='order_created_brin'),
+        ]
+        # таблица разбита на месячные секции по created_at, уникальный ключ включает ключ секций
+        constraints = [
+            models.UniqueConstraint(fields=['order_id', 'created_at'], name='order_order_id_created_uniq'),
         ]
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
@@ -248,20 +260,30 @@ class Transaction(models.Model):
         on_delete=models.CASCADE,
         verbose_name='заказ',
         related_name='transaction_order',
-        db_index=True
+        db_index=True,
+        # заказы разбиты на секции, внешний ключ в PostgreSQL возможен только вместе с created_at
+        db_constraint=False
     )
 
-    transaction_id = models.CharField(max_length=255, verbose_name='id заказа', unique=True)
+    transaction_id = models.CharField(max_length=255, verbose_name='id заказа')
     event_at = models.DateTimeField(verbose_name='завершен')
     category_id = models.CharField(max_length=255, verbose_name='id категории', blank=True, default='')
     category_name = models.CharField(max_length=255, verbose_name='название категории', blank=True, default='')
     group_id = models.CharField(max_length=255, verbose_name='группа', blank=True, default='')
     amount = models.DecimalField(decimal_places=4, max_digits=15, verbose_name='стоимость')
     description = models.CharField(max_length=5000, verbose_name='описание')
+    fingerprint = models.CharField(max_length=40, verbose_name='хеш загруженных данных', blank=True, default='')
 
     class Meta:
         indexes = [
-            models.Index(fields=['transaction_id'])
+            # транзакции водителя за период
+            models.Index(fields=['driver', 'event_at'], name='transaction_driver_event_idx'),
+            # транзакции всех парков за период (BRIN, как у заказов)
+            BrinIndex(fields=['event_at'], name='transaction_event_brin'),
+        ]
+        # таблица разбита на месячные секции по event_at
+        constraints = [
+            models.UniqueConstraint(fields=['transaction_id', 'event_at'], name='transaction_id_event_uniq'),
         ]
         verbose_name = 'транзакция'
         verbose_name_plural = 'транзакции'
@@ -296,4 +318,178 @@ class DateProcessing(models.Model):
         get_latest_by = 'last_processed_date'
 
     def __str__(self):
-        return f'Последняя обработка: {self.last_processed_date}'
\ No newline at end of file
+        return f'Последняя обработка: {self.last_processed_date}'
+
+
+class ParkSyncState(models.Model):
+    """Состояние синхронизации парка по виду данных"""
+    ENTITY_DRIVERS = 'drivers'
+    ENTITY_ORDERS = 'orders'
+    ENTITY_CHOICES = [
+        (ENTITY_DRIVERS, 'водители'),
+        (ENTITY_ORDERS, 'заказы'),
+    ]
+
+    park = models.ForeignKey(
+        Park,
+        on_delete=models.CASCADE,
+        verbose_name='парк',
+        related_name='sync_states'
+    )
+    entity = models.CharField(max_length=32, choices=ENTITY_CHOICES, verbose_name='вид данных')
+    watermark = models.DateTimeField(
+        verbose_name='загружено по',
+        blank=True,
+        null=True,
+        default=None
+    )
+    full_sync_at = models.DateTimeField(
+        verbose_name='последняя полная загрузка',
+        blank=True,
+        null=True,
+        default=None
+    )
+    updated_at = models.DateTimeField(verbose_name='дата обновления', auto_now=True)
+
+    class Meta:
+        unique_together = ('park', 'entity')
+        verbose_name = 'состояние синхронизации'
+        verbose_name_plural = 'состояния синхронизации'
+        ordering = ['park', 'entity']
+
+    def __str__(self):
+        return f'{self.park} - {self.get_entity_display()}'
+
+
+class BackfillUnit(models.Model):
+    """Дозагрузка заказов парка за день"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'в очереди'),
+        (STATUS_RUNNING, 'выполняется'),
+        (STATUS_DONE, 'загружено'),
+        (STATUS_FAILED, 'ошибка'),
+    ]
+
+    park = models.ForeignKey(
+        Park,
+        on_delete=models.CASCADE,
+        verbose_name='парк',
+        related_name='backfill_units'
+    )
+    date = models.DateField(verbose_name='дата')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='статус')
+    attempts = models.PositiveSmallIntegerField(verbose_name='попыток', default=0)
+    orders_loaded = models.PositiveIntegerField(verbose_name='загружено заказов', default=0)
+    error = models.CharField(max_length=1000, verbose_name='ошибка', blank=True, default='')
+    started_at = models.DateTimeField(verbose_name='начало', blank=True, null=True, default=None)
+    finished_at = models.DateTimeField(verbose_name='окончание', blank=True, null=True, default=None)
+    updated_at = models.DateTimeField(verbose_name='дата обновления', auto_now=True)
+
+    class Meta:
+        unique_together = ('park', 'date')
+        verbose_name = 'дозагрузка за день'
+        verbose_name_plural = 'дозагрузка за дни'
+        ordering = ['date', 'park']
+
+    def __str__(self):
+        return f'{self.park} - {self.date}'
+
+
+class ArchiveMonth(models.Model):
+    """Заказы и транзакции парка за месяц, выгруженные в архив и удаленные из БД"""
+    park = models.ForeignKey(
+        Park,
+        on_delete=models.CASCADE,
+        verbose_name='парк',
+        related_name='archive_months'
+    )
+    month = models.DateField(verbose_name='месяц')
+    orders_count = models.PositiveIntegerField(verbose_name='заказов', default=0)
+    transactions_count = models.PositiveIntegerField(verbose_name='транзакций', default=0)
+    path = models.CharField(max_length=500, verbose_name='каталог архива')
+    archived_at = models.DateTimeField(verbose_name='дата архивации', auto_now_add=True)
+    restored_at = models.DateTimeField(verbose_name='возвращен в БД', blank=True, null=True, default=None)
+
+    class Meta:
+        unique_together = ('park', 'month')
+        verbose_name = 'архив за месяц'
+        verbose_name_plural = 'архив за месяцы'
+        ordering = ['month', 'park']
+
+    def __str__(self):
+        return f'{self.park} - {self.month:%Y-%m}'
+
+
+class DayStats(models.Model):
+    """Итоги за сутки по московскому времени: заказы по created_at, транзакции по event_at"""
+    day = models.DateField(verbose_name='день')
+    orders_count = models.PositiveIntegerField(verbose_name='заказов', default=0)
+    completed_count = models.PositiveIntegerField(verbose_name='выполнено', default=0)
+    cancelled_count = models.PositiveIntegerField(verbose_name='отменено', default=0)
+    revenue = models.DecimalField(decimal_places=4, max_digits=15, verbose_name='выручка', default=0)
+    mileage = models.DecimalField(decimal_places=4, max_digits=15, verbose_name='пробег', default=0)
+    transactions_count = models.PositiveIntegerField(verbose_name='транзакций', default=0)
+    transactions_amount = models.DecimalField(
+        decimal_places=4,
+        max_digits=15,
+        verbose_name='сумма транзакций',
+        default=0
+    )
+    # {category_id: {'name': название, 'count': число, 'amount': 'сумма'}}
+    transactions_by_category = models.JSONField(verbose_name='транзакции по категориям', default=dict, blank=True)
+    updated_at = models.DateTimeField(verbose_name='дата обновления', auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class ParkDayStats(DayStats):
+    """Итоги парка за день"""
+    park = models.ForeignKey(
+        Park,
+        on_delete=models.CASCADE,
+        verbose_name='парк',
+        related_name='day_stats'
+    )
+
+    class Meta:
+        unique_together = ('park', 'day')
+        verbose_name = 'итоги парка за день'
+        verbose_name_plural = 'итоги парков за дни'
+        ordering = ['-day', 'park']
+
+    def __str__(self):
+        return f'{self.park} - {self.day}'
+
+
+class DriverDayStats(DayStats):
+    """Итоги водителя за день"""
+    park = models.ForeignKey(
+        Park,
+        on_delete=models.CASCADE,
+        verbose_name='парк',
+        related_name='driver_day_stats'
+    )
+    driver = models.ForeignKey(
+        Driver,
+        on_delete=models.CASCADE,
+        verbose_name='водитель',
+        related_name='day_stats'
+    )
+
+    class Meta:
+        unique_together = ('driver', 'day')
+        indexes = [
+            # итоги водителей парка за период
+            models.Index(fields=['park', 'day'], name='driverdaystats_park_day_idx'),
+        ]
+        verbose_name = 'итоги водителя за день'
+        verbose_name_plural = 'итоги водителей за дни'
+        ordering = ['-day', 'driver']
+
+    def __str__(self):
+        return f'{self.driver} - {self.day}'
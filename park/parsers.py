@@ -0,0 +1,161 @@
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from dateutil import parser as date_parser
+from django.utils.dateparse import parse_datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    """Разбор тела ответа (bytes) быстрым декодером, если он установлен"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def parse_decimal(value, default=Decimal(0)):
+    """Число из ответа API (строка или число) в Decimal, пустое или некорректное значение - default"""
+    if value is None or value == '':
+        return default
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return default
+
+
+def parse_float(value):
+    """Координата из ответа API в float, пустое или некорректное значение - None"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_date(value):
+    """Дата из ответа API ('2020-01-31' или '2020-01-31T00:00:00+0000'), пустое или некорректное значение - None"""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    try:
+        return date_parser.parse(value).date()
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+@dataclass(slots=True)
+class OrderRecord:
+    """Заказ из Fleet API: только поля, которые пишет load_order"""
+    id: str
+    short_id: str
+    category: str
+    created_at: datetime
+    ended_at: str | None
+    status: str
+    payment_method: str
+    price: Decimal
+    address_from: str
+    address_from_lat: float | None
+    address_from_lon: float | None
+    address_to: str
+    address_to_lat: float | None
+    address_to_lon: float | None
+    mileage: Decimal
+    cancellation_description: str
+    driver_id: str | None
+    car_id: str | None
+
+    @classmethod
+    def from_dict(cls, order_data):
+        # Безопасное получение адреса назначения
+        route_points = order_data.get('route_points') or []
+        if route_points:  # Если есть точки маршрута
+            last_point = route_points[-1]
+            address_to = last_point['address']
+            address_to_lat = parse_float(last_point.get('lat'))
+            address_to_lon = parse_float(last_point.get('lon'))
+        else:  # Если точек маршрута нет
+            address_to = ''
+            address_to_lat = None
+            address_to_lon = None
+
+        address_from = order_data['address_from']
+        driver_profile = order_data.get('driver_profile')
+        car = order_data.get('car')
+
+        return cls(
+            id=order_data['id'],
+            short_id=order_data['short_id'],
+            category=order_data.get('category', ''),
+            created_at=parse_datetime(order_data['created_at']),
+            ended_at=order_data.get('ended_at'),
+            status=order_data['status'],
+            payment_method=order_data.get('payment_method', ''),
+            price=parse_decimal(order_data.get('price')),
+            address_from=address_from['address'],
+            address_from_lat=parse_float(address_from.get('lat')),
+            address_from_lon=parse_float(address_from.get('lon')),
+            address_to=address_to,
+            address_to_lat=address_to_lat,
+            address_to_lon=address_to_lon,
+            mileage=parse_decimal(order_data.get('mileage')),
+            cancellation_description=order_data.get('cancellation_description', ''),
+            driver_id=driver_profile['id'] if driver_profile else None,
+            car_id=car['id'] if car else None,
+        )
+
+
+@dataclass(slots=True)
+class TransactionRecord:
+    """Транзакция из Fleet API: только поля, которые пишет load_transactions"""
+    id: str
+    order_id: str
+    event_at: datetime
+    category_id: str
+    category_name: str
+    group_id: str
+    amount: Decimal
+    description: str
+
+    @classmethod
+    def from_dict(cls, transaction_data):
+        return cls(
+            id=transaction_data['id'],
+            order_id=transaction_data['order_id'],
+            event_at=parse_datetime(transaction_data['event_at']),
+            category_id=transaction_data.get('category_id', ''),
+            category_name=transaction_data.get('category_name', ''),
+            group_id=transaction_data.get('group_id', ''),
+            amount=parse_decimal(transaction_data.get('amount')),
+            description=transaction_data.get('description', ''),
+        )
+
+
+def parse_page(content, key, record=None):
+    """
+    Разбор страницы ответа с курсором за один проход.
+    Возвращает (записи, курсор); если задан record, записи переводятся в типизированные объекты.
+    """
+    json_response = loads(content)
+    items = json_response.get(key) or []
+    if record is not None:
+        items = [record.from_dict(item) for item in items]
+    return items, json_response.get('cursor')
+
+
+def parse_orders_page(content):
+    """Страница списка заказов"""
+    return parse_page(content, 'orders', OrderRecord)
+
+
+def parse_transactions_page(content):
+    """Страница списка транзакций по заказам"""
+    return parse_page(content, 'transactions', TransactionRecord)
@@ -0,0 +1,109 @@
+import logging
+from datetime import date, datetime
+
+import pytz
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from park.models import Order, Transaction
+
+logger = logging.getLogger(__name__)
+
+# таблицы, разбитые на месячные секции: {модель: поле времени}
+PARTITIONED_MODELS = {
+    Order: 'created_at',
+    Transaction: 'event_at',
+}
+
+
+def get_month_start(value):
+    """Первый день месяца даты или момента времени (по московскому времени)"""
+    if isinstance(value, datetime):
+        value = timezone.localtime(value, pytz.timezone('Europe/Moscow')).date()
+    return date(value.year, value.month, 1)
+
+
+def get_next_month(month):
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+
+def add_months(month, count):
+    for _ in range(count):
+        month = get_next_month(month)
+    return month
+
+
+def iter_months(date_from, date_to):
+    """Первые дни месяцев с date_from по date_to включительно"""
+    month = get_month_start(date_from)
+    while month <= date_to:
+        yield month
+        month = get_next_month(month)
+
+
+def get_month_bounds(month):
+    """Границы месяца по московскому времени"""
+    moscow = pytz.timezone('Europe/Moscow')
+    return (
+        moscow.localize(datetime(month.year, month.month, 1)),
+        moscow.localize(datetime.combine(get_next_month(month), datetime.min.time())),
+    )
+
+
+def get_partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def create_partition(cursor, table, column, month, parent=None):
+    """
+    Секция таблицы за месяц, если ее еще нет: возвращает True, если создана.
+    Секция создается отдельной таблицей и подключается через ATTACH PARTITION - он не блокирует
+    запись в основную таблицу. Строки месяца, попавшие в секцию по умолчанию, переносятся в новую секцию.
+    """
+    parent = parent or table
+    name = get_partition_name(table, month)
+    cursor.execute('SELECT to_regclass(%s)', [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+
+    start, end = get_month_bounds(month)
+    with transaction.atomic():
+        cursor.execute(f'CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {table}_default WHERE {column} >= %s AND {column} < %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved',
+            [start, end]
+        )
+        if cursor.rowcount:
+            logger.warning(f'В секцию {name} перенесено строк из секции по умолчанию: {cursor.rowcount}')
+        cursor.execute(f'ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', [start, end])
+    return True
+
+
+def ensure_partitions(date_from=None, date_to=None):
+    """
+    Месячные секции заказов и транзакций с date_from по date_to.
+    По умолчанию - с текущего месяца на PARTITIONS_MONTHS_AHEAD месяцев вперед.
+    Возвращает имена созданных секций.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+
+    today = timezone.localdate()
+    date_from = date_from or today
+    date_to = date_to or add_months(get_month_start(today), settings.PARTITIONS_MONTHS_AHEAD)
+
+    created = []
+    with connection.cursor() as cursor:
+        for model, field_name in PARTITIONED_MODELS.items():
+            table = model._meta.db_table
+            column = model._meta.get_field(field_name).column
+            for month in iter_months(date_from, date_to):
+                if create_partition(cursor, table, column, month):
+                    created.append(get_partition_name(table, month))
+    if created:
+        logger.info(f'Созданы секции: {", ".join(created)}')
+    return created
@@ -0,0 +1,73 @@
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+from park.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Атомарно пополняет корзину по времени Redis и пытается взять один токен.
+# Возвращает 0, если токен получен, иначе сколько секунд ждать до следующего токена.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+_script = None
+
+
+def get_bucket_config(url_path):
+    """Размер корзины и скорость пополнения (токенов в секунду) для эндпоинта"""
+    limits = settings.FLEET_API_RATE_LIMITS
+    return limits.get(url_path, limits['default'])
+
+
+def acquire_token(park_id, url_path):
+    """
+    Ожидание свободного токена в общей для всех воркеров корзине парка и эндпоинта.
+    При недоступности Redis запрос не блокируется.
+    """
+    global _script
+
+    capacity, rate = get_bucket_config(url_path)
+    key = f'fleet_api:bucket:{park_id}:{url_path}'
+    deadline = time.monotonic() + settings.FLEET_API_RATE_LIMIT_MAX_WAIT
+
+    while True:
+        try:
+            client = get_redis()
+            if _script is None:
+                _script = client.register_script(TOKEN_BUCKET_SCRIPT)
+            wait = float(_script(keys=[key], args=[capacity, rate], client=client))
+        except redis.RedisError as e:
+            logger.error(f'Ограничитель запросов недоступен: {e} {park_id}')
+            return
+
+        if wait <= 0:
+            return
+
+        if time.monotonic() + wait > deadline:
+            logger.error(f'Превышено время ожидания токена {url_path} для парка {park_id}')
+            return
+        time.sleep(wait)
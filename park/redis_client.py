@@ -0,0 +1,29 @@
+import os
+import threading
+
+import redis
+from django.conf import settings
+
+# Клиент процесса: создается лениво и пересоздается после fork воркера celery
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_redis():
+    """Клиент Redis для общих данных воркеров (лимиты запросов, кэш, блокировки)"""
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = redis.Redis.from_url(
+                    settings.REDIS_SERVER_1,
+                    username=settings.REDIS_USERNAME,
+                    password=settings.REDIS_PASSWORD,
+                    socket_timeout=5,
+                    socket_connect_timeout=5,
+                )
+                _client_pid = pid
+    return _client
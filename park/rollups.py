@@ -0,0 +1,215 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytz
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from park.models import ArchiveMonth, DriverDayStats, Order, ParkDayStats, Transaction
+from park.upsert import upsert
+
+# статусы заказов Fleet API
+STATUS_COMPLETE = 'complete'
+STATUS_CANCELLED = 'cancelled'
+
+# колонки итогов, которые пересчитывает каждый загрузчик: загрузка заказов и загрузка транзакций
+# обновляют каждая только свои колонки и не затирают друг другу итоги одного дня
+ORDERS_FIELDS = ['orders_count', 'completed_count', 'cancelled_count', 'revenue', 'mileage']
+TRANSACTIONS_FIELDS = ['transactions_count', 'transactions_amount', 'transactions_by_category']
+
+
+def get_moscow():
+    return pytz.timezone('Europe/Moscow')
+
+
+def get_day(value):
+    """День момента времени по московскому времени"""
+    return timezone.localtime(value, get_moscow()).date()
+
+
+def get_days_bounds(days):
+    """Границы периода с первого по последний день по московскому времени"""
+    moscow = get_moscow()
+    return (
+        moscow.localize(datetime.combine(min(days), datetime.min.time())),
+        moscow.localize(datetime.combine(max(days) + timedelta(days=1), datetime.min.time())),
+    )
+
+
+def get_touched_days(objs, field_name):
+    """Дни записанных заказов или транзакций по паркам: {park_id: {день}}"""
+    days = defaultdict(set)
+    for obj in objs:
+        days[obj.park_id].add(get_day(getattr(obj, field_name)))
+    return days
+
+
+def get_orders_totals(park_id, days):
+    """Итоги заказов парка за дни: {(driver_id, день): {колонка: значение}}, у заказов без водителя driver_id - None"""
+    start, end = get_days_bounds(days)
+    complete = Q(status=STATUS_COMPLETE)
+    rows = (
+        Order.objects.filter(park_id=park_id, created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at', tzinfo=get_moscow()))
+        .order_by()
+        .values('driver_id', 'day')
+        .annotate(
+            orders_count=Count('pk'),
+            completed_count=Count('pk', filter=complete),
+            cancelled_count=Count('pk', filter=Q(status=STATUS_CANCELLED)),
+            revenue=Sum('price', filter=complete),
+            mileage=Sum('mileage', filter=complete),
+        )
+    )
+    return {
+        (row['driver_id'], row['day']): {
+            'orders_count': row['orders_count'],
+            'completed_count': row['completed_count'],
+            'cancelled_count': row['cancelled_count'],
+            'revenue': row['revenue'] or Decimal(0),
+            'mileage': row['mileage'] or Decimal(0),
+        }
+        for row in rows
+        if row['day'] in days
+    }
+
+
+def get_transactions_totals(park_id, days):
+    """Итоги транзакций парка за дни: {(driver_id, день): {колонка: значение}}"""
+    start, end = get_days_bounds(days)
+    rows = (
+        Transaction.objects.filter(park_id=park_id, event_at__gte=start, event_at__lt=end)
+        .annotate(day=TruncDate('event_at', tzinfo=get_moscow()))
+        .order_by()
+        .values('driver_id', 'day', 'category_id', 'category_name')
+        .annotate(count=Count('pk'), amount=Sum('amount'))
+    )
+    totals = {}
+    for row in rows:
+        if row['day'] not in days:
+            continue
+        item = totals.setdefault((row['driver_id'], row['day']), get_empty_totals(TRANSACTIONS_FIELDS))
+        categories = item['transactions_by_category']
+        add_category(categories, row['category_id'], row['category_name'], row['count'], row['amount'])
+        item['transactions_count'] += row['count']
+        item['transactions_amount'] += row['amount']
+    return totals
+
+
+def get_empty_totals(fields):
+    """Нулевые итоги колонок fields"""
+    return {field: ParkDayStats._meta.get_field(field).get_default() for field in fields}
+
+
+def add_category(categories, category_id, name, count, amount):
+    """Добавление к итогам категории; суммы в JSON хранятся строкой, чтобы не терять точность"""
+    item = categories.setdefault(category_id, {'name': name, 'count': 0, 'amount': '0'})
+    item['name'] = name or item['name']
+    item['count'] += count
+    item['amount'] = str(Decimal(item['amount']) + amount)
+
+
+def sum_totals(totals, fields):
+    """Итоги парка по дням из итогов водителей: {день: {колонка: значение}}"""
+    park_totals = defaultdict(lambda: get_empty_totals(fields))
+    for (_, day), item in totals.items():
+        park_item = park_totals[day]
+        for field in fields:
+            if field == 'transactions_by_category':
+                for category_id, category in item[field].items():
+                    add_category(
+                        park_item[field], category_id, category['name'], category['count'], Decimal(category['amount'])
+                    )
+            else:
+                park_item[field] += item[field]
+    return park_totals
+
+
+def lock_days(park_id, days):
+    """
+    Блокировка пересчета дней парка до конца транзакции. Строк итогов за новый день еще нет,
+    поэтому блокируются не строки, а ключи (парк, день). Дни берутся по порядку, чтобы не было взаимоблокировок.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for day in sorted(days):
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'day_stats:{park_id}:{day}'])
+
+
+def exclude_archived_days(park_id, days):
+    """
+    Дни без месяцев, выгруженных в архив: заказов и транзакций этих месяцев нет в БД,
+    пересчет по оставшимся строкам затер бы итоги, поэтому итоги архивированных месяцев не меняются.
+    """
+    archived = set(
+        ArchiveMonth.objects.filter(park_id=park_id, restored_at__isnull=True).values_list('month', flat=True)
+    )
+    return {day for day in days if day.replace(day=1) not in archived}
+
+
+def write_totals(park_id, days, get_totals, fields):
+    """
+    Пересчет колонок fields итогов парка и водителей за дни, кроме дней архивированных месяцев.
+    Сначала колонки дней обнуляются: заказ мог перейти к другому водителю или другому дню.
+    Параллельный пересчет тех же дней ждет завершения и считает итоги уже по записанным данным.
+    """
+    days = exclude_archived_days(park_id, days)
+    if not days:
+        return
+    with transaction.atomic():
+        lock_days(park_id, days)
+        for model in (ParkDayStats, DriverDayStats):
+            model.objects.filter(park_id=park_id, day__in=days).update(**get_empty_totals(fields))
+        totals = get_totals(park_id, days)
+        park_totals = sum_totals(totals, fields)
+        upsert(
+            ParkDayStats,
+            [ParkDayStats(park_id=park_id, day=day, **item) for day, item in park_totals.items()],
+            unique_fields=['park', 'day'],
+            update_fields=[*fields, 'updated_at']
+        )
+        upsert(
+            DriverDayStats,
+            [
+                DriverDayStats(park_id=park_id, driver_id=driver_id, day=day, **item)
+                for (driver_id, day), item in totals.items()
+                if driver_id is not None
+            ],
+            unique_fields=['driver', 'day'],
+            update_fields=[*fields, 'updated_at']
+        )
+
+
+def refresh_orders_stats(parks_days):
+    """Пересчет итогов заказов за дни: {park_id: {день}}"""
+    for park_id, days in parks_days.items():
+        write_totals(park_id, days, get_orders_totals, ORDERS_FIELDS)
+
+
+def refresh_transactions_stats(parks_days):
+    """Пересчет итогов транзакций за дни: {park_id: {день}}"""
+    for park_id, days in parks_days.items():
+        write_totals(park_id, days, get_transactions_totals, TRANSACTIONS_FIELDS)
+
+
+def refresh_day_stats(park, date_from, date_to):
+    """
+    Полный пересчет итогов парка с date_from по date_to включительно.
+    Пересчет идет по месяцам, чтобы не держать долгих транзакций. Возвращает число пересчитанных дней.
+    """
+    months = defaultdict(set)
+    day = date_from
+    while day <= date_to:
+        months[day.replace(day=1)].add(day)
+        day += timedelta(days=1)
+    days_count = 0
+    for days in months.values():
+        days = exclude_archived_days(park.pk, days)
+        refresh_orders_stats({park.pk: days})
+        refresh_transactions_stats({park.pk: days})
+        days_count += len(days)
+    return days_count
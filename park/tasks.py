@@ -1,47 +1,198 @@
 from datetime import datetime, timedelta
+from functools import partial
 
-from celery import shared_task
+from celery import chord, shared_task
 from celery.utils.log import get_task_logger
-
-from irules_stats.celery import app
+from django.conf import settings
+
+from irules_stats.celery import (
+    app,
+    QUEUE_BACKFILL,
+    QUEUE_LIVE,
+    QUEUE_REFERENCE,
+    PRIORITY_BACKFILL,
+    PRIORITY_LIVE,
+    PRIORITY_REFERENCE,
+)
+from park.archive import archive_old_data
+from park.backfill import create_backfill_units, run_backfill_unit
+from park.locks import hold_lock
+from park.metrics import SYNC_RUNS_SKIPPED
+from park.partitions import ensure_partitions
 from park.views import (
     load_work_rules,
     load_yandex_driver_profiles,
     load_order,
     load_cars,
     load_transactions,
-    process_dates_with_resume
+    get_parks_by_size,
+    get_active_parks,
 )
 
 logger = get_task_logger(__name__)
 
 
+# загрузчики, которые запускаются отдельной задачей на каждый парк
+PARK_LOADERS = {
+    'work_rules': load_work_rules,
+    'drivers': load_yandex_driver_profiles,
+    'orders': load_order,
+    'cars': load_cars,
+    'transactions': load_transactions,
+    'transactions_drain': partial(load_transactions, drain=True),
+}
+
+# загрузчики с общей блокировкой парка: разбор очереди и обычная загрузка транзакций
+# берут заказы из одной очереди и не должны загружать один парк одновременно
+PARK_LOADERS_LOCKS = {
+    'transactions_drain': 'transactions',
+}
+
+# очередь и приоритет задач парков по загрузчику
+PARK_LOADERS_QUEUES = {
+    'work_rules': (QUEUE_REFERENCE, PRIORITY_REFERENCE),
+    'drivers': (QUEUE_REFERENCE, PRIORITY_REFERENCE),
+    'orders': (QUEUE_LIVE, PRIORITY_LIVE),
+    'cars': (QUEUE_REFERENCE, PRIORITY_REFERENCE),
+    'transactions': (QUEUE_LIVE, PRIORITY_LIVE),
+    'transactions_drain': (QUEUE_BACKFILL, PRIORITY_BACKFILL),
+}
+
+
+@app.task
+def load_park_celery(loader, park_id):
+    """Загрузка данных одного парка, если предыдущая загрузка этого парка уже закончилась"""
+    with hold_lock(f'{PARK_LOADERS_LOCKS.get(loader, loader)}:{park_id}') as acquired:
+        if not acquired:
+            SYNC_RUNS_SKIPPED.labels(loader).inc()
+            logger.info(f'Загрузка {loader} парка {park_id} пропущена: предыдущая еще выполняется')
+            return {'park': park_id, 'overlap': True}
+        try:
+            response = PARK_LOADERS[loader](park_ids=[park_id])
+        except Exception as e:
+            # ошибка парка не должна срывать итог по остальным паркам
+            logger.error(f'Ошибка загрузки {loader} парка {park_id}: {e}')
+            return {'park': park_id, 'error': str(e)}
+    data = getattr(response, 'data', None) or {}
+    return {'park': park_id, 'written': data.get('written', 0), 'skipped': data.get('skipped', 0)}
+
+
+@app.task
+def report_parks_celery(results, loader):
+    """Итог загрузки по всем паркам"""
+    failed = [result['park'] for result in results if 'error' in result]
+    overlapped = [result['park'] for result in results if result.get('overlap')]
+    written = sum(result.get('written', 0) for result in results)
+    skipped = sum(result.get('skipped', 0) for result in results)
+    logger.info(
+        f'Загрузка {loader}: парков {len(results)}, записано {written}, без изменений {skipped}, '
+        f'с ошибкой {len(failed)}, пропущено {len(overlapped)}'
+    )
+    return {'parks': len(results), 'written': written, 'skipped': skipped, 'failed': failed, 'overlapped': overlapped}
+
+
+def dispatch_parks(loader):
+    """
+    Запуск загрузки отдельной задачей на каждый парк: задачи распределяются по всем воркерам,
+    малые парки ставятся в очередь первыми. Итог собирает report_parks_celery.
+    Общей блокировки запуска нет: парк, предыдущая загрузка которого еще идет, пропускается
+    своей задачей, а остальные парки загружаются по расписанию.
+    """
+    park_ids = get_parks_by_size()
+    if not park_ids:
+        return 0
+    queue, priority = PARK_LOADERS_QUEUES[loader]
+    chord(
+        load_park_celery.s(loader, park_id).set(queue=queue, priority=priority)
+        for park_id in park_ids
+    )(report_parks_celery.s(loader).set(queue=queue, priority=priority))
+    return len(park_ids)
+
+
 @app.task
 def load_work_rules_celery():
-    load_work_rules()
+    return dispatch_parks('work_rules')
 
 
 @app.task
 def load_yandex_driver_profiles_celery():
-    load_yandex_driver_profiles()
+    return dispatch_parks('drivers')
 
 
 @app.task
 def load_order_celery():
-    load_order()
+    return dispatch_parks('orders')
 
 
 @app.task
 def load_cars_celery():
-    load_cars()
+    return dispatch_parks('cars')
 
 
 @app.task
 def load_transactions_celery():
-    load_transactions()
+    return dispatch_parks('transactions')
 
 
 @app.task
-def load_old_orders_celery():
-    process_dates_with_resume()
+def drain_transactions_celery():
+    return dispatch_parks('transactions_drain')
+
+
+@app.task(bind=True, max_retries=settings.BACKFILL_MAX_RETRIES)
+def backfill_unit_celery(self, unit_id):
+    """Дозагрузка заказов парка за день с повторами после ошибки"""
+    with hold_lock(f'backfill:{unit_id}') as acquired:
+        if not acquired:
+            # та же часть уже выполняется после повторного запуска дозагрузки
+            SYNC_RUNS_SKIPPED.labels('backfill').inc()
+            return {'unit': unit_id, 'status': 'running', 'orders': 0}
+        try:
+            status, orders = run_backfill_unit(unit_id)
+        except Exception as e:
+            if self.request.retries < self.max_retries:
+                raise self.retry(exc=e, countdown=settings.BACKFILL_RETRY_DELAY * 2 ** self.request.retries)
+            # после последней попытки часть остается с ошибкой, остальные части и отчет продолжают работу
+            return {'unit': unit_id, 'status': 'failed', 'orders': 0}
+    return {'unit': unit_id, 'status': status, 'orders': orders}
+
 
+@app.task
+def backfill_report_celery(results, date_from, date_to):
+    """Итог дозагрузки"""
+    failed = [result['unit'] for result in results if result['status'] == 'failed']
+    orders = sum(result['orders'] for result in results)
+    logger.info(f'Дозагрузка {date_from} - {date_to}: частей {len(results)}, заказов {orders}, с ошибкой {len(failed)}')
+    return {'units': len(results), 'orders': orders, 'failed': failed}
+
+
+@app.task
+def load_old_orders_celery(date_from, date_to, park_ids=None):
+    """Дозагрузка заказов за период: части (парк, день) выполняются параллельно на всех воркерах"""
+    date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
+    date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
+    unit_ids = create_backfill_units(date_from, date_to, park_ids)
+    if not unit_ids:
+        return None
+    chord(backfill_unit_celery.s(unit_id) for unit_id in unit_ids)(
+        backfill_report_celery.s(str(date_from), str(date_to))
+    )
+    return len(unit_ids)
+
+
+@app.task
+def create_partitions_celery():
+    """Секции заказов и транзакций на PARTITIONS_MONTHS_AHEAD месяцев вперед"""
+    return ensure_partitions()
+
+
+@app.task
+def archive_old_data_celery():
+    """Архивация старых месяцев всех парков, если предыдущая архивация уже закончилась"""
+    with hold_lock('archive') as acquired:
+        if not acquired:
+            SYNC_RUNS_SKIPPED.labels('archive').inc()
+            return None
+        orders, transactions = archive_old_data(get_active_parks())
+    logger.info(f'Архив: заказов {orders}, транзакций {transactions}')
+    return {'orders': orders, 'transactions': transactions}
@@ -1,3 +1,426 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import os
+import tempfile
+import time
+from unittest import skipIf
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from park import archive
+from park.breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitOpenError, check_circuit, get_breaker, get_breaker_key,
+    record_failure
+)
+from park.locks import acquire_lock, hold_lock, release_lock
+from park.models import (
+    ArchiveMonth, Car, Driver, DriverDayStats, DriverWorkRule, Order, Park, ParkDayStats, ParkSyncState, Transaction
+)
+from park.parsers import OrderRecord, TransactionRecord
+from park.partitions import get_month_bounds, get_month_start, iter_months
+from park.ratelimit import acquire_token
+from park.redis_client import get_redis
+from park.rollups import get_touched_days, refresh_orders_stats, refresh_transactions_stats
+from park.upsert import upsert
+from park.utils import FleetApiError, api_request, fetch_offset_pages
+from park.views import load_order, load_transactions, load_yandex_driver_profiles, write_orders_page
+
+
+def make_profiles(prefix, count):
+    """Ответ driver-profiles/list на count водителей"""
+    return [
+        {
+            'driver_profile': {
+                'id': f'{prefix}{i}',
+                'last_name': 'Иванов',
+                'first_name': 'Иван',
+                'work_status': 'working',
+                'work_rule_id': 'rule',
+                'created_date': '2025-01-01T10:00:00+0000',
+                'driver_license': {
+                    'normalized_number': f'77{i:08}',
+                    'country': 'rus',
+                    'issue_date': '2015-06-01T00:00:00+0000',
+                },
+            },
+            'accounts': [
+                {'id': f'{prefix}{i}', 'balance': '100.0000', 'currency': 'RUB', 'type': 'current'},
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def make_orders(count, prefix='order'):
+    """Страница заказов (OrderRecord) без водителей и автомобилей"""
+    return [
+        OrderRecord(
+            id=f'{prefix}{i}', short_id=str(i), category='econom',
+            created_at=datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc), ended_at=None, status='complete',
+            payment_method='cash', price=Decimal('100'), address_from='', address_from_lat=None,
+            address_from_lon=None, address_to='', address_to_lat=None, address_to_lon=None,
+            mileage=Decimal('5'), cancellation_description='', driver_id=None, car_id=None
+        )
+        for i in range(count)
+    ]
+
+
+class ParkTestCase(TestCase):
+    """Тест с парком self.park; информация о парке из API при сохранении не запрашивается"""
+
+    def setUp(self):
+        self.park = self.create_park('park')
+
+    def create_park(self, park_id):
+        with patch('park.utils.get_park_info', return_value=None):
+            return Park.objects.create(park_id=park_id, api_key='key', client_id='client')
+
+
+@skipIf(fakeredis is None, 'нужен fakeredis')
+class FakeRedisTestCase(TestCase):
+    """Тест с Redis в памяти вместо общего Redis воркеров"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.multiple('park.redis_client', _client=fakeredis.FakeRedis(), _client_pid=os.getpid())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class LoadYandexDriverProfilesTest(ParkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.work_rule = DriverWorkRule.objects.create(
+            park=self.park,
+            work_rule_id='rule',
+            is_enabled=True,
+            name='Условие'
+        )
+
+    def run_loader(self, prefix, count):
+        """Полная загрузка count новых водителей, возвращает число SQL-запросов"""
+        ParkSyncState.objects.all().delete()
+        data = {'driver_profiles': make_profiles(prefix, count)}
+        with patch('park.views.get_profiles_list', return_value=data):
+            with CaptureQueriesContext(connection) as queries:
+                load_yandex_driver_profiles()
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_drivers(self):
+        few = self.run_loader('a', 5)
+        many = self.run_loader('b', 50)
+
+        self.assertEqual(few, many)
+        self.assertEqual(Driver.objects.filter(park=self.park, work_rule=self.work_rule).count(), 55)
+        self.assertFalse(Driver.objects.filter(account__isnull=True).exists())
+
+    def test_typed_values(self):
+        self.run_loader('a', 1)
+
+        driver = Driver.objects.select_related('account').get(driver_id='a0')
+        self.assertEqual(driver.created_date, date(2025, 1, 1))
+        self.assertEqual(driver.driver_license_issue_date, date(2015, 6, 1))
+        self.assertIsNone(driver.driver_license_expiration_date)
+        self.assertEqual(driver.account.balance, Decimal('100'))
+
+
+class FetchOffsetPagesTest(TestCase):
+
+    def test_failed_page_fails_whole_list(self):
+        def request(method, url_path, park_id, api_key, client_id, json):
+            response = Mock(status_code=500 if json['offset'] == 2 else 200)
+            response.json.return_value = {'total': 5, 'items': [{'id': json['offset']}, {'id': json['offset'] + 1}]}
+            return response
+
+        with patch('park.utils.api_request', side_effect=request):
+            self.assertIsNone(
+                fetch_offset_pages('/list', 'park', 'key', 'client', {}, 'items', lambda item: item['id'], limit=2)
+            )
+
+
+class UpsertSkipUnchangedTest(ParkTestCase):
+
+    def write_car(self, status):
+        car = Car(park=self.park, car_id='car', brand='Kia', model='Rio', year=2020, status=status)
+        written, skipped = upsert(Car, [car], unique_fields=['car_id'], update_fields=['status'], skip_unchanged=True)
+        return len(written), skipped
+
+    def test_unchanged_rows_are_skipped(self):
+        self.assertEqual(self.write_car('working'), (1, 0))
+        self.assertEqual(self.write_car('working'), (0, 1))
+        self.assertEqual(self.write_car('repairing'), (1, 0))
+        self.assertEqual(Car.objects.get(car_id='car').status, 'repairing')
+
+
+class PartitionMonthsTest(TestCase):
+
+    def test_months_and_bounds(self):
+        self.assertEqual(
+            list(iter_months(date(2025, 11, 15), date(2026, 2, 1))),
+            [date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1), date(2026, 2, 1)]
+        )
+        start, end = get_month_bounds(date(2025, 12, 1))
+        self.assertEqual(start.isoformat(), '2025-12-01T00:00:00+03:00')
+        self.assertEqual(end.isoformat(), '2026-01-01T00:00:00+03:00')
+        # 31 декабря 22:30 UTC - уже январь по московскому времени
+        self.assertEqual(get_month_start(datetime(2025, 12, 31, 22, 30, tzinfo=dt_timezone.utc)), date(2026, 1, 1))
+
+
+@skipIf(archive.pa is None, 'нужен pyarrow')
+class ArchiveTest(ParkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        driver = Driver.objects.create(park=self.park, driver_id='driver', last_name='Иванов')
+        for i, created_at in enumerate((datetime(2025, 1, 10, tzinfo=dt_timezone.utc), timezone.now())):
+            order = Order.objects.create(
+                park=self.park, driver=driver, order_id=f'order{i}', short_id=str(i), created_at=created_at,
+                price=Decimal('123.4500'), load_transaction_complete=True
+            )
+            Transaction.objects.create(
+                park=self.park, driver=driver, order=order, transaction_id=f'tx{i}', event_at=created_at,
+                amount=Decimal('-10.5000'), description='списание'
+            )
+
+    def test_archive_and_restore(self):
+        with tempfile.TemporaryDirectory() as archive_dir, override_settings(ARCHIVE_DIR=archive_dir):
+            self.assertEqual(archive.archive_old_data([self.park], after_days=30), (1, 1))
+            self.assertEqual(list(Order.objects.values_list('order_id', flat=True)), ['order1'])
+            self.assertEqual(ArchiveMonth.objects.get().month, date(2025, 1, 1))
+
+            archived_at = ArchiveMonth.objects.get().archived_at
+            self.assertEqual(archive.restore_park_month(self.park, date(2025, 1, 1)), (1, 1))
+            self.assertEqual(ArchiveMonth.objects.get().archived_at, archived_at)
+            restored = Transaction.objects.select_related('order').get(transaction_id='tx0')
+            self.assertEqual(restored.order.order_id, 'order0')
+            self.assertEqual(restored.order.price, Decimal('123.4500'))
+            self.assertEqual(restored.amount, Decimal('-10.5000'))
+            # возвращенный месяц автоматически не архивируется снова
+            self.assertEqual(archive.archive_old_data([self.park], after_days=30), (0, 0))
+
+
+class DayStatsTest(ParkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.drivers = [
+            Driver.objects.create(park=self.park, driver_id=f'driver{i}', last_name='Иванов') for i in range(2)
+        ]
+        # 21:30 UTC - уже следующий день по московскому времени
+        self.orders = [
+            Order.objects.create(
+                park=self.park, driver=self.drivers[0], order_id=f'order{i}', short_id=str(i), created_at=created_at,
+                status=order_status, price=Decimal('100.5000'), mileage=Decimal('10')
+            )
+            for i, (created_at, order_status) in enumerate((
+                (datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc), 'complete'),
+                (datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc), 'cancelled'),
+                (datetime(2025, 3, 1, 21, 30, tzinfo=dt_timezone.utc), 'complete'),
+            ))
+        ]
+
+    def test_orders_and_transactions_totals(self):
+        refresh_orders_stats(get_touched_days(self.orders, 'created_at'))
+        transactions = [
+            Transaction.objects.create(
+                park=self.park, driver=self.drivers[0], order=self.orders[0], transaction_id=f'tx{i}',
+                event_at=self.orders[0].created_at, category_id=category_id, category_name=category_id,
+                amount=amount, description=''
+            )
+            for i, (category_id, amount) in enumerate((('cash', Decimal('100.5')), ('fee', Decimal('-3.25'))))
+        ]
+        refresh_transactions_stats(get_touched_days(transactions, 'event_at'))
+
+        day = ParkDayStats.objects.get(park=self.park, day=date(2025, 3, 1))
+        self.assertEqual((day.orders_count, day.completed_count, day.cancelled_count), (2, 1, 1))
+        self.assertEqual((day.revenue, day.mileage), (Decimal('100.5'), Decimal('10')))
+        self.assertEqual((day.transactions_count, day.transactions_amount), (2, Decimal('97.25')))
+        fee = day.transactions_by_category['fee']
+        self.assertEqual((fee['count'], Decimal(fee['amount'])), (1, Decimal('-3.25')))
+        self.assertEqual(ParkDayStats.objects.get(day=date(2025, 3, 2)).orders_count, 1)
+
+        # заказ перешел к другому водителю: итоги старого водителя за день пересчитываются
+        Order.objects.filter(pk=self.orders[1].pk).update(driver=self.drivers[1])
+        refresh_orders_stats(get_touched_days(self.orders[1:2], 'created_at'))
+        self.assertEqual(
+            dict(DriverDayStats.objects.filter(day=date(2025, 3, 1)).values_list('driver__driver_id', 'orders_count')),
+            {'driver0': 1, 'driver1': 1}
+        )
+        # итоги транзакций не затираются пересчетом заказов
+        self.assertEqual(ParkDayStats.objects.get(day=date(2025, 3, 1)).transactions_count, 2)
+
+        # месяц выгружен в архив: оставшиеся в БД заказы не затирают его итоги
+        ArchiveMonth.objects.create(park=self.park, month=date(2025, 3, 1), path='archive')
+        Order.objects.filter(pk=self.orders[0].pk).delete()
+        refresh_orders_stats(get_touched_days(self.orders[1:2], 'created_at'))
+        self.assertEqual(ParkDayStats.objects.get(day=date(2025, 3, 1)).orders_count, 2)
+
+
+class WriteOrdersPageTest(ParkTestCase):
+
+    def test_failed_stats_refresh_rolls_back_orders(self):
+        with patch('park.views.refresh_orders_stats', side_effect=RuntimeError('lock timeout')):
+            with self.assertRaises(RuntimeError):
+                write_orders_page(self.park, make_orders(2))
+        self.assertFalse(Order.objects.exists())
+
+        # следующая загрузка записывает те же заказы и пересчитывает итоги
+        self.assertEqual(write_orders_page(self.park, make_orders(2)), (2, 0))
+        self.assertEqual(ParkDayStats.objects.get(park=self.park, day=date(2025, 3, 1)).orders_count, 2)
+
+
+class MetricsViewTest(TestCase):
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/park/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/park/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/park/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_disabled_without_token(self):
+        self.assertEqual(self.client.get('/park/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+
+@override_settings(FLEET_API_BREAKER_THRESHOLD=2, FLEET_API_BREAKER_COOLDOWN=600)
+class BreakerTest(FakeRedisTestCase):
+
+    def request(self, status_code):
+        """Запрос парка с ответом status_code"""
+        with patch('park.utils.get_session') as get_session:
+            get_session.return_value.request.return_value = Mock(status_code=status_code)
+            return api_request('POST', '/v1/parks/cars/list', 'park', 'key', 'client')
+
+    def end_cooldown(self):
+        get_redis().hset(get_breaker_key('park'), 'opened_at', time.time() - 601)
+
+    def test_open_half_open_closed(self):
+        self.request(500)
+        self.assertEqual(get_breaker('park')[0], STATE_CLOSED)
+        self.request(500)
+        self.assertEqual(get_breaker('park')[0], STATE_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.request(200)
+
+        # после паузы проходит один пробный запрос, неудачная проба снова отключает парк
+        self.end_cooldown()
+        self.assertEqual(check_circuit('park')[0], STATE_HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            check_circuit('park')
+        record_failure('park', STATE_HALF_OPEN)
+        self.assertEqual(get_breaker('park')[0], STATE_OPEN)
+
+        # ответ 429 на пробу значит, что API и ключ работают
+        self.end_cooldown()
+        self.assertEqual(self.request(429).status_code, 429)
+        self.assertEqual(get_breaker('park'), (STATE_CLOSED, 0, None))
+        self.assertEqual(self.request(200).status_code, 200)
+
+
+class RateLimitTest(FakeRedisTestCase):
+
+    @override_settings(FLEET_API_RATE_LIMITS={'default': (2, 20)})
+    def test_waits_for_refill(self):
+        sleep = time.sleep
+        with patch('park.ratelimit.time.sleep', side_effect=sleep) as waits:
+            for _ in range(3):
+                acquire_token('park', '/v1/parks/cars/list')
+        # два токена из полной корзины, третий - после пополнения: 1 токен / 20 в секунду
+        self.assertEqual(waits.call_count, 1)
+        self.assertTrue(0 < waits.call_args[0][0] <= 0.05)
+
+
+class LocksTest(FakeRedisTestCase):
+
+    def test_nested_acquire_and_ownership(self):
+        with hold_lock('orders:park') as acquired:
+            self.assertTrue(acquired)
+            with hold_lock('orders:park') as nested:
+                self.assertFalse(nested)
+            # чужой токен блокировку не снимает
+            release_lock('orders:park', 'other')
+            self.assertIsNone(acquire_lock('orders:park', 60))
+        self.assertTrue(acquire_lock('orders:park', 60))
+
+    def test_heartbeat_extends_lock(self):
+        with hold_lock('orders:park', ttl=1):
+            time.sleep(1.5)
+            self.assertIsNone(acquire_lock('orders:park', 1))
+
+
+class LoadOrderWatermarkTest(ParkTestCase):
+
+    def test_watermark_not_moved_for_failed_parks(self):
+        self.create_park('failed_fetch')
+        self.create_park('failed_write')
+
+        def iter_pages(park, ended_at_from, ended_at_to, whole_days=True):
+            if park.park_id == 'failed_fetch':
+                raise FleetApiError('429')
+            yield make_orders(1, prefix=park.park_id)
+
+        def write(park, order_entries):
+            if park.park_id == 'failed_write':
+                raise RuntimeError('db')
+            return len(order_entries), 0
+
+        with patch('park.views.iter_park_orders_pages', side_effect=iter_pages), \
+                patch('park.views.write_orders_page', side_effect=write):
+            load_order()
+
+        # отметка сдвигается только у парка, все страницы которого загружены и записаны
+        states = ParkSyncState.objects.filter(entity=ParkSyncState.ENTITY_ORDERS)
+        self.assertEqual([state.park.park_id for state in states], ['park'])
+        self.assertLess(timezone.now() - states[0].watermark, timedelta(minutes=1))
+
+
+class DrainTransactionsTest(ParkTestCase):
+
+    def setUp(self):
+        super().setUp()
+        driver = Driver.objects.create(park=self.park, driver_id='driver', last_name='Иванов')
+        for i in range(3):
+            Order.objects.create(
+                park=self.park, driver=driver, order_id=f'order{i}', short_id=str(i),
+                created_at=datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc), price=Decimal('100'), mileage=Decimal('5')
+            )
+
+    def iter_pages(self, park_id, api_key, client_id, order_ids, delay=0):
+        time.sleep(delay)
+        yield [
+            TransactionRecord(
+                id=f'tx_{order_id}', order_id=order_id, event_at=datetime(2025, 3, 1, 11, tzinfo=dt_timezone.utc),
+                category_id='cash', category_name='Наличные', group_id='cash', amount=Decimal('100'), description=''
+            )
+            for order_id in order_ids
+        ]
+
+    def test_drain_empties_queue(self):
+        with patch('park.views.iter_park_transactions_pages', side_effect=self.iter_pages):
+            response = load_transactions(drain=True)
+
+        self.assertEqual(response.data['written'], 3)
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertFalse(Order.objects.filter(load_transaction_complete=False).exists())
+
+    def test_deadline_leaves_orders_pending(self):
+        def iter_slow_pages(*args):
+            return self.iter_pages(*args, delay=1.1)
+
+        with patch('park.views.iter_park_transactions_pages', side_effect=iter_slow_pages):
+            response = load_transactions(drain=True, time_budget=1)
+
+        # страница пришла после истечения времени: ни транзакции, ни метки заказов не пишутся
+        self.assertEqual(response.data['written'], 0)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.assertEqual(Order.objects.filter(load_transaction_complete=False).count(), 3)
@@ -0,0 +1,155 @@
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.db import connection, models, transaction
+
+
+def get_copy_value(value):
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def get_field_copy_value(field, obj):
+    """Значение поля объекта в текстовом формате COPY"""
+    value = field.pre_save(obj, True)
+    if isinstance(field, models.JSONField):
+        # адаптер JSON драйвера дает литерал SQL, а не текст значения
+        return get_copy_value(None if value is None else json.dumps(value, cls=field.encoder))
+    return get_copy_value(field.get_db_prep_save(value, connection))
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Передача строк в таблицу через COPY (psycopg2 и psycopg 3)"""
+    data = io.StringIO()
+    for row in rows:
+        data.write('\t'.join(row))
+        data.write('\n')
+    data.seek(0)
+
+    sql = f'COPY {table} ({", ".join(columns)}) FROM STDIN'
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'):
+        raw_cursor.copy_expert(sql, data)
+    else:
+        with raw_cursor.copy(sql) as copy:
+            copy.write(data.getvalue())
+
+
+def get_unique_objs(model, objs, unique_fields):
+    """Объекты без повторов по уникальному ключу: при повторе остается последний"""
+    attnames = [model._meta.get_field(name).attname for name in unique_fields]
+    unique_objs = {}
+    for obj in objs:
+        unique_objs[tuple(getattr(obj, attname) for attname in attnames)] = obj
+    return list(unique_objs.values())
+
+
+def get_fingerprint(obj, fields):
+    """Хеш значений полей объекта"""
+    values = '\x1f'.join(str(getattr(obj, field.attname)) for field in fields)
+    return hashlib.sha1(values.encode()).hexdigest()
+
+
+def get_changed_objs(model, objs, unique_fields, update_fields):
+    """
+    Объекты, которых нет в БД или у которых изменились обновляемые поля.
+    Проставляет объектам fingerprint - хеш обновляемых полей.
+    """
+    opts = model._meta
+    fields = [opts.get_field(name) for name in update_fields]
+    attnames = [opts.get_field(name).attname for name in unique_fields]
+    for obj in objs:
+        obj.fingerprint = get_fingerprint(obj, fields)
+
+    # сохраненные хеши выбираем по последнему полю ключа, оно самое избирательное
+    lookup = {f'{attnames[-1]}__in': {getattr(obj, attnames[-1]) for obj in objs}}
+    # поля времени ключа ограничивают выборку диапазоном пакета: в таблицах с секциями по времени
+    # PostgreSQL читает только секции этого диапазона, а не индексы всех секций
+    for name in unique_fields[:-1]:
+        field = opts.get_field(name)
+        if isinstance(field, models.DateTimeField):
+            values = [getattr(obj, field.attname) for obj in objs]
+            lookup[f'{field.attname}__gte'] = min(values)
+            lookup[f'{field.attname}__lte'] = max(values)
+    saved = {
+        tuple(row[:-1]): row[-1]
+        for row in model.objects.filter(**lookup).values_list(*attnames, 'fingerprint')
+    }
+    return [
+        obj for obj in objs
+        if saved.get(tuple(getattr(obj, attname) for attname in attnames)) != obj.fingerprint
+    ]
+
+
+def upsert(model, objs, unique_fields, update_fields, chunk_size=None, skip_unchanged=False):
+    """
+    Вставка или обновление объектов по уникальному ключу.
+    В PostgreSQL строки передаются через COPY во временную таблицу и переносятся одним
+    INSERT ... ON CONFLICT DO UPDATE на каждые UPSERT_CHUNK_SIZE строк, в остальных базах - bulk_create.
+    С skip_unchanged строки, у которых не изменился хеш обновляемых полей, не пишутся.
+    Возвращает (записанные объекты без повторов, число пропущенных без изменений).
+    """
+    objs = get_unique_objs(model, objs, unique_fields)
+    skipped = 0
+    if objs and skip_unchanged:
+        changed = get_changed_objs(model, objs, unique_fields, update_fields)
+        skipped = len(objs) - len(changed)
+        objs = changed
+        update_fields = [*update_fields, 'fingerprint']
+    if not objs:
+        return objs, skipped
+
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_create(
+            objs,
+            batch_size=100,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields
+        )
+        return objs, skipped
+
+    chunk_size = chunk_size or settings.UPSERT_CHUNK_SIZE
+    quote_name = connection.ops.quote_name
+    opts = model._meta
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    columns = [quote_name(field.column) for field in fields]
+    unique_columns = [quote_name(opts.get_field(name).column) for name in unique_fields]
+    update_columns = [quote_name(opts.get_field(name).column) for name in update_fields]
+
+    table = quote_name(opts.db_table)
+    staging = quote_name(f'{opts.db_table}_upsert')
+    if update_columns:
+        on_conflict = 'DO UPDATE SET ' + ', '.join(f'{column} = EXCLUDED.{column}' for column in update_columns)
+    else:
+        on_conflict = 'DO NOTHING'
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # временная таблица без ограничений с колонками основной, удаляется при завершении транзакции
+        cursor.execute(
+            f'CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS '
+            f'SELECT {", ".join(columns)} FROM {table} WITH NO DATA'
+        )
+        for i in range(0, len(objs), chunk_size):
+            chunk = objs[i:i + chunk_size]
+            rows = ([get_field_copy_value(field, obj) for field in fields] for obj in chunk)
+            cursor.execute(f'TRUNCATE {staging}')
+            copy_rows(cursor, staging, columns, rows)
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) '
+                f'SELECT {", ".join(columns)} FROM {staging} '
+                f'ON CONFLICT ({", ".join(unique_columns)}) {on_conflict}'
+            )
+    return objs, skipped
@@ -3,4 +3,5 @@ from django.urls import path
 from park.views import *
 
 urlpatterns = [
+    path('metrics/', metrics, name='metrics'),
 ]
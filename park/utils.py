@@ -1,13 +1,26 @@
 import json
 import logging
 import math
+import os
+import queue
+import threading
 import time
 
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from functools import lru_cache, partial
 
 import pytz
 import requests
+from dateutil.parser import isoparse
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from park.breaker import CircuitOpenError, STATE_CLOSED, check_circuit, record_failure, record_success
+from park.cache import CACHE_PARK_INFO, CACHE_TRANSACTION_CATEGORIES, get_cached, get_park_info_key
+from park.metrics import API_PAGES, API_RETRIES, observe_api_response
+from park.parsers import parse_page, parse_orders_page, parse_transactions_page
+from park.ratelimit import acquire_token
 
 logger = logging.getLogger(__name__)
 
@@ -55,34 +68,213 @@ def get_headers(park_id, api_key, client_id):
     return headers
 
 
-def get_total(park_id, api_key, client_id, URL):
-    """Данные для получения общего количества"""
-    data = {
-        'fields': {
-            'car': [],
-            'current_status': []
-        },
-        'limit': 1,
-        'offset': 0,
-        'query': {
-            'park': {
-                'id': park_id
-            },
-        }
-    }
-    headers = get_headers(park_id, api_key, client_id)
-    response = requests.request('POST', URL, headers=headers, json=data)
-    if response.status_code == 200:
-        json_response = response.json()
-        # получили общее количество
-        total = json_response.get('total')
-        return total
-    return None
+# HTTP-сессия процесса: создается лениво и пересоздается после fork воркера celery
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Сессия с пулом keep-alive соединений к Fleet API (одна на процесс)"""
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.FLEET_API_POOL_SIZE,
+                )
+                session.mount(URL_API_YANDEX, adapter)
+                _session = session
+                _session_pid = pid
+    return _session
+
+
+@lru_cache(maxsize=1024)
+def get_park_headers(park_id, api_key, client_id):
+    """Заголовки парка, собранные один раз на процесс"""
+    return get_headers(park_id, api_key, client_id)
+
+
+def api_request(method, url_path, park_id, api_key, client_id, **kwargs):
+    """
+    Запрос к Fleet API через общий пул соединений с учетом лимита запросов и предохранителя парка.
+    Для отключенного парка выбрасывает CircuitOpenError без обращения к API.
+    """
+    headers = get_park_headers(park_id, api_key, client_id)
+    state, failures = check_circuit(park_id)
+    acquire_token(park_id, url_path)
+    kwargs.setdefault('timeout', settings.FLEET_API_TIMEOUT)
+
+    started = time.monotonic()
+    try:
+        response = get_session().request(method, URL_API_YANDEX + url_path, headers=headers, **kwargs)
+    except requests.RequestException:
+        observe_api_response(url_path, park_id, 'error', time.monotonic() - started)
+        record_failure(park_id, state)
+        raise
+    observe_api_response(url_path, park_id, response.status_code, time.monotonic() - started)
+
+    # Отозванный ключ и ошибки сервера размыкают предохранитель. Любой другой ответ, в том числе 429
+    # и 4xx по запросу, значит, что API и ключ работают: предохранитель замыкается, пробный запрос завершен
+    if response.status_code in (401, 403) or response.status_code >= 500:
+        record_failure(park_id, state)
+    elif state != STATE_CLOSED or failures:
+        record_success(park_id)
+    return response
+
+
+def iter_parks_data(parks, fetch, concurrency=None):
+    """
+    Параллельная загрузка данных из Fleet API по паркам в ограниченном пуле потоков.
+    fetch(park) выполняется в рабочем потоке и не должен обращаться к БД.
+    Возвращает пары (парк, данные) по мере готовности, запись в БД остается в вызывающем потоке.
+    """
+    parks = list(parks)
+    if not parks:
+        return
+
+    max_workers = min(concurrency or settings.FLEET_API_PARKS_CONCURRENCY, len(parks))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fleet-api') as executor:
+        futures = {executor.submit(fetch, park): park for park in parks}
+        for future in as_completed(futures):
+            park = futures[future]
+            try:
+                data = future.result()
+            except CircuitOpenError as e:
+                logger.warning(f'Парк пропущен: {e}')
+                continue
+            except Exception as e:
+                logger.error(f'Ошибка загрузки данных парка {park.park_id}: {e}')
+                continue
+            yield park, data
+
+
+def put_until_stopped(pages, stop, item):
+    """Запись в ограниченную очередь страниц, пока читатель не остановился: возвращает False после остановки"""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def iter_parks_pages(parks, iter_pages, concurrency=None, max_pending_pages=None):
+    """
+    Параллельная постраничная загрузка по паркам: iter_pages(park) выполняется в рабочем потоке
+    и не должен обращаться к БД. Страницы отдаются парами (парк, страница) по мере получения,
+    очередь между загрузкой и записью ограничена, поэтому в памяти держится не больше
+    max_pending_pages страниц. После успешной загрузки всех страниц парка отдается (парк, None).
+    """
+    parks = list(parks)
+    if not parks:
+        return
+
+    max_workers = min(concurrency or settings.FLEET_API_PARKS_CONCURRENCY, len(parks))
+    pages = queue.Queue(maxsize=max_pending_pages or max_workers * 2)
+    stop = threading.Event()
+    finished = object()
+
+    def put(item):
+        return put_until_stopped(pages, stop, item)
+
+    def produce(park):
+        try:
+            # после остановки чтения оставшиеся в очереди парки не загружаются
+            if stop.is_set():
+                return
+            for page in iter_pages(park):
+                if not put((park, page)):
+                    return
+            put((park, None))
+        except CircuitOpenError as e:
+            logger.warning(f'Парк пропущен: {e}')
+        except Exception as e:
+            logger.error(f'Ошибка загрузки данных парка {park.park_id}: {e}')
+        finally:
+            put((park, finished))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fleet-api') as executor:
+        for park in parks:
+            executor.submit(produce, park)
+
+        remaining = len(parks)
+        try:
+            while remaining:
+                park, page = pages.get()
+                if page is finished:
+                    remaining -= 1
+                    continue
+                yield park, page
+        finally:
+            stop.set()
+
+
+def fetch_offset_pages(url_path, park_id, api_key, client_id, data, key, get_id, limit=1000, concurrency=None):
+    """
+    Загрузка всех страниц эндпоинта с offset-пагинацией.
+    Общее количество берется из первой страницы, остальные страницы загружаются параллельно.
+    Возвращает записи без дубликатов в порядке страниц или None, если не получена хотя бы одна страница:
+    неполный список не должен сдвигать отметки синхронизации.
+    """
+    def fetch_page(offset):
+        page_data = dict(data, limit=limit, offset=offset)
+        response = api_request('POST', url_path, park_id, api_key, client_id, json=page_data)
+        if response.status_code != 200:
+            logger.error(f'Ошибка загрузки страницы {url_path} offset={offset}: {response.status_code} {park_id}')
+            return None
+        API_PAGES.labels(url_path, park_id).inc()
+        return response.json()
+
+    first_page = fetch_page(0)
+    if not first_page:
+        return None
+
+    total = first_page.get('total') or 0
+    pages = [first_page.get(key) or []]
+
+    offsets = list(range(limit, total, limit))
+    if offsets:
+        max_workers = min(concurrency or settings.FLEET_API_PAGES_CONCURRENCY, len(offsets))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fleet-api-page') as executor:
+            # map сохраняет порядок страниц независимо от порядка получения ответов
+            for page in executor.map(fetch_page, offsets):
+                if not page:
+                    executor.shutdown(cancel_futures=True)
+                    return None
+                pages.append(page.get(key) or [])
+
+    # Между запросами страницы могут сдвинуться, поэтому убираем повторы
+    seen_ids = set()
+    json_total = []
+    for page in pages:
+        for item in page:
+            item_id = get_id(item)
+            if item_id in seen_ids:
+                continue
+            seen_ids.add(item_id)
+            json_total.append(item)
+    return json_total
 
 
 def get_park_info(park_id, api_key, client_id):
-    """Информация о парке"""
-    URL = URL_API_YANDEX + URL_API_GET_DRIVER_PROFILES
+    """Информация о парке (кэшируется по парку и его ключам)"""
+    data, _ = get_cached(
+        CACHE_PARK_INFO,
+        get_park_info_key(park_id, api_key, client_id),
+        lambda: fetch_park_info(park_id, api_key, client_id)
+    )
+    return data
+
+
+def fetch_park_info(park_id, api_key, client_id):
+    """Информация о парке из API"""
+    url_path = URL_API_GET_DRIVER_PROFILES
     try:
         park_id.encode('latin-1')
         api_key.encode('latin-1')
@@ -93,9 +285,6 @@ def get_park_info(park_id, api_key, client_id):
         response = {"message": "Вероятнее всего Вы ошиблись при вводе данных."}
         return json.dumps(response)
 
-    # заголовки
-    headers = get_headers(park_id, api_key, client_id)
-
     data = {
         'fields': {
             'account': [],
@@ -112,77 +301,176 @@ def get_park_info(park_id, api_key, client_id):
         }
     }
 
-    response = requests.request('POST', URL, headers=headers, json=data)
+    try:
+        response = api_request('POST', url_path, park_id, api_key, client_id, json=data)
+    except (CircuitOpenError, requests.RequestException) as e:
+        logger.error(f'Информация о парке не получена: {e}')
+        return None
     if response.status_code == 200:
         return response.json()['parks'][0]
     logger.error(response.text)
     return None
 
 
-def get_profiles_list(park_id, api_key, client_id):
-    """Получить список водителей (курьеров) парка"""
-    URL = URL_API_YANDEX + URL_API_GET_DRIVER_PROFILES
+def get_profile_updated_at(driver_data):
+    """Время последнего изменения профиля водителя или None, если его нет в ответе"""
+    driver_profile = driver_data['driver_profile']
+    value = driver_profile.get('updated_at') or driver_profile.get('modified_date')
+    if not value:
+        return None
+    try:
+        return isoparse(value)
+    except ValueError:
+        return None
 
-    # заголовки
-    headers = get_headers(park_id, api_key, client_id)
 
-    # получили общее количество
+def fetch_profiles_updated_since(park_id, api_key, client_id, data, updated_since, limit=200):
+    """
+    Профили, измененные не раньше updated_since.
+    Страницы отсортированы по updated_at по убыванию, загрузка останавливается на первом более старом профиле.
+    """
+    offset = 0
+    json_total = []
+
+    while True:
+        page_data = dict(data, limit=limit, offset=offset)
+        response = api_request('POST', URL_API_GET_DRIVER_PROFILES, park_id, api_key, client_id, json=page_data)
+        if response.status_code != 200:
+            logger.error(f'Ошибка в обновлении списка водителей {response.status_code} {park_id}')
+            return None
+
+        API_PAGES.labels(URL_API_GET_DRIVER_PROFILES, park_id).inc()
+        json_response = response.json()
+        profiles = json_response.get('driver_profiles') or []
+        for driver_data in profiles:
+            updated_at = get_profile_updated_at(driver_data)
+            if updated_at is not None and updated_at < updated_since:
+                return json_total
+            json_total.append(driver_data)
+
+        offset += limit
+        if len(profiles) < limit or offset >= (json_response.get('total') or 0):
+            return json_total
+
+
+def get_profiles_list(park_id, api_key, client_id, updated_since=None):
+    """
+    Получить список водителей (курьеров) парка.
+    С updated_since загружаются только профили, измененные с этого момента.
+    """
+    data = {
+        'query': {
+            'park': {
+                'id': park_id,
+            }
+        },
+        'sort_order': [
+            {
+                'direction': 'desc',
+                'field': 'updated_at'
+            }
+        ]
+    }
+
     try:
-        total = get_total(park_id, api_key, client_id, URL)
+        if updated_since:
+            json_total = fetch_profiles_updated_since(park_id, api_key, client_id, data, updated_since)
+            if json_total is None:
+                return None
+            return {
+                'driver_profiles': json_total
+            }
+
+        json_total = fetch_offset_pages(
+            URL_API_GET_DRIVER_PROFILES,
+            park_id, api_key, client_id, data,
+            'driver_profiles',
+            lambda item: item['driver_profile']['id'],
+        )
     except UnicodeEncodeError:
         return None
 
-    if not total:
+    if json_total is None:
+        logger.error(f'Ошибка в обновлении списка водителей {park_id}')
+        return None
+    if not json_total:
         return None
 
-    limit = 1000
-    offset = 0
-    count_pages = math.ceil(total / limit)
-
-    json_total = None
-    for page in range(count_pages):
-        count_profiles = total - (page * limit)
-        if count_profiles > limit:
-            count_profiles = limit
-
-        data = {
-            'limit': limit,
-            'offset': offset,
-            'query': {
-                'park': {
-                    'id': park_id,
-                }
-            },
-            'sort_order': [
-                {
-                    'direction': 'desc',
-                    'field': 'updated_at'
-                }
-            ]
-        }
-        offset += count_profiles
+    return {
+        'driver_profiles': json_total
+    }
+
+
+class FleetApiError(Exception):
+    """Ошибка при постраничной загрузке из Fleet API"""
+
 
-        response = requests.request('POST', URL, headers=headers, json=data)
+def request_with_backoff(url_path, park_id, api_key, client_id, data, label):
+    """POST-запрос с экспоненциальной задержкой при ошибке 429"""
+    delay = 30  # начальная задержка 30 секунд
+    max_attempts = 10  # максимальное количество попыток
+    attempt = 0
+
+    while attempt < max_attempts:
+        response = api_request('POST', url_path, park_id, api_key, client_id, json=data)
 
         if response.status_code == 200:
-            if not json_total:
-                json_total = response.json()['driver_profiles']
-            json_total += response.json()['driver_profiles']
+            return response
+        elif response.status_code == 429:
+            attempt += 1
+            API_RETRIES.labels(url_path, park_id).inc()
+            logger.error(f'Ошибка 429 при запросе {label}. Попытка {attempt}. Ждем {delay} сек. Park: {park_id}')
+            time.sleep(delay)
+            delay *= 2  # удваиваем задержку
         else:
-            logger.error(f'Ошибка в обновлении списка водителей {response.status_code} {park_id}')
+            logger.error(f'Ошибка загрузки {label}: {response.status_code} {response.text} Park: {park_id}')
+            return response
 
-    return {
-        'driver_profiles': json_total
-    }
+    logger.error(f'Превышено максимальное количество попыток ({max_attempts}) для {label} парк {park_id}')
+    return None
 
 
-def post_orders_list(park_id, api_key, client_id, ended_at_from, ended_at_to):
-    """Получение списка заказов с экспоненциальной задержкой при ошибке 429"""
-    URL = URL_API_YANDEX + URL_API_POST_ORDERS_LIST
+def fetch_cursor_page(url_path, park_id, api_key, client_id, data, label, parse):
+    """Одна страница по курсору: (записи, курсор), при ошибке выбрасывает FleetApiError"""
+    response = request_with_backoff(url_path, park_id, api_key, client_id, data, label)
+    if response is None or response.status_code != 200:
+        raise FleetApiError(f'Ошибка загрузки {label} Park: {park_id}')
 
-    # заголовки
-    headers = get_headers(park_id, api_key, client_id)
+    API_PAGES.labels(url_path, park_id).inc()
+    try:
+        return parse(response.content)
+    except ValueError as e:
+        logger.error(f'Ошибка декодирования JSON для {label}: {e} {response.text} Park: {park_id}')
+        raise FleetApiError(f'Ошибка декодирования JSON для {label} Park: {park_id}') from e
+
+
+def iter_cursor_pages(url_path, park_id, api_key, client_id, data, key, label, parse=None):
+    """
+    Постраничная загрузка по курсору: возвращает записи каждой страницы по мере получения.
+    Тело каждой страницы разбирается один раз функцией parse(content) -> (записи, курсор),
+    по умолчанию записи остаются словарями.
+    При ошибке запроса выбрасывает FleetApiError, уже отданные страницы остаются у вызывающего.
+    """
+    if parse is None:
+        parse = partial(parse_page, key=key)
+    data = dict(data)
+
+    while True:
+        items, cursor = fetch_cursor_page(url_path, park_id, api_key, client_id, data, label, parse)
+
+        yield items
 
+        # Обработка курсора
+        if not cursor:
+            return
+        data['cursor'] = cursor
+
+
+def get_orders_query(park_id, ended_at_from, ended_at_to, limit=500, whole_days=True):
+    """
+    Тело запроса списка заказов за период по ended_at.
+    По умолчанию период расширяется до целых суток, whole_days=False оставляет точные границы.
+    """
     # Проверяем, являются ли ended_at_from и ended_at_to строками
     if isinstance(ended_at_from, str):
         ended_at_from_dt = datetime.strptime(ended_at_from, "%Y-%m-%d")
@@ -194,18 +482,18 @@ def post_orders_list(park_id, api_key, client_id, ended_at_from, ended_at_to):
     else:
         ended_at_to_dt = ended_at_to  # Если это уже datetime, преобразование не нужно
 
-    # Устанавливаем время и добавляем временную зону
-    ended_at_from_dt = ended_at_from_dt.replace(hour=0, minute=0, second=0, tzinfo=pytz.timezone('Europe/Moscow'))
-    ended_at_to_dt = ended_at_to_dt.replace(hour=23, minute=59, second=59, tzinfo=pytz.timezone('Europe/Moscow'))
+    if whole_days:
+        # Устанавливаем время и добавляем временную зону
+        ended_at_from_dt = ended_at_from_dt.replace(
+            hour=0, minute=0, second=0, tzinfo=pytz.timezone('Europe/Moscow'))
+        ended_at_to_dt = ended_at_to_dt.replace(
+            hour=23, minute=59, second=59, tzinfo=pytz.timezone('Europe/Moscow'))
 
     # Преобразуем в ISO 8601
     ended_at_from_iso = ended_at_from_dt.isoformat()
     ended_at_to_iso = ended_at_to_dt.isoformat()
 
-    # получили общее количество
-    limit = 500
-
-    data = {
+    return {
         'limit': limit,
         'query': {
             'park': {
@@ -220,65 +508,160 @@ def post_orders_list(park_id, api_key, client_id, ended_at_from, ended_at_to):
         }
     }
 
-    json_total = []
 
-    def make_request():
-        nonlocal data, headers
-        delay = 30  # начальная задержка 30 секунд
-        max_attempts = 10  # максимальное количество попыток
-        attempt = 0
-
-        while attempt < max_attempts:
-            response = requests.request('POST', URL, headers=headers, json=data)
-
-            if response.status_code == 200:
-                return response
-            elif response.status_code == 429:
-                attempt += 1
-                logger.error(f'Ошибка 429. Попытка {attempt}. Ждем {delay} секунд. {park_id}')
-                time.sleep(delay)
-                delay *= 2  # удваиваем задержку
-            else:
-                logger.error(f'Ошибка загрузки заказов: {response.status_code} {response.text} {park_id}')
-                return response
-
-        logger.error(f'Превышено максимальное количество попыток ({max_attempts}) для парка {park_id}')
-        return None
+def iter_orders_pages(park_id, api_key, client_id, ended_at_from, ended_at_to, parse=parse_orders_page,
+                      whole_days=True):
+    """Постраничная загрузка заказов (OrderRecord) с экспоненциальной задержкой при ошибке 429"""
+    data = get_orders_query(park_id, ended_at_from, ended_at_to, whole_days=whole_days)
+    return iter_cursor_pages(
+        URL_API_POST_ORDERS_LIST,
+        park_id, api_key, client_id, data,
+        'orders', 'заказов', parse
+    )
 
-    # Первый запрос
-    response = make_request()
-    if response and response.status_code == 200:
-        json_total = response.json().get('orders', [])
 
-        # Обработка курсора
-        while response.json().get('cursor'):
-
-            cursor = {'cursor': response.json().get('cursor')}
-            data.update(cursor)
-
-            response = make_request()
-            if response and response.status_code == 200:
-                try:
-                    json_total.extend(response.json().get('orders', []))
-                except ValueError as e:
-                    print("Ошибка декодирования JSON:", e)
-                    print("Текст ответа:", response.text)
-                    logger.error(f'Ошибка декодирования JSON: {e} {response.text}')
-            else:
-                break
+def split_orders_window(window_from, window_to, orders, limit):
+    """
+    Разбиение периода на подпериоды по плотности заказов первой страницы:
+    число подпериодов рассчитано так, чтобы каждый укладывался примерно в одну страницу.
+    """
+    window_seconds = (window_to - window_from).total_seconds()
+
+    ended_at = []
+    for order in orders:
+        try:
+            ended_at.append(datetime.fromisoformat(order.ended_at))
+        except (TypeError, ValueError):
+            continue
+    span_seconds = (max(ended_at) - min(ended_at)).total_seconds() if len(ended_at) > 1 else 0
+
+    if span_seconds > 0:
+        expected_orders = len(orders) * window_seconds / span_seconds
+    else:
+        # Плотность не определить - делим на число параллельных загрузок
+        expected_orders = limit * settings.FLEET_API_PAGES_CONCURRENCY
+
+    count = math.ceil(expected_orders / limit)
+    count = min(
+        count,
+        settings.FLEET_API_ORDERS_MAX_WINDOWS,
+        int(window_seconds // settings.FLEET_API_ORDERS_MIN_WINDOW),
+    )
+    if count < 2:
+        return []
+
+    step = timedelta(seconds=window_seconds / count)
+    # Соседние подпериоды пересекаются на границе, повторы отсекаются по id заказа
+    return [
+        (window_from + step * i, window_to if i == count - 1 else window_from + step * (i + 1))
+        for i in range(count)
+    ]
+
+
+def iter_orders_pages_split(park_id, api_key, client_id, ended_at_from, ended_at_to, concurrency=None,
+                            whole_days=True):
+    """
+    Постраничная загрузка заказов (OrderRecord) с дроблением периода для загруженных парков.
+    Если период не помещается в одну страницу, он делится на подпериоды по плотности заказов,
+    подпериоды загружаются параллельно, заказы отдаются без повторов по id.
+    """
+    url_path = URL_API_POST_ORDERS_LIST
+    data = get_orders_query(park_id, ended_at_from, ended_at_to, whole_days=whole_days)
+    limit = data['limit']
+    ended_at = data['query']['park']['order']['ended_at']
+    window_from = datetime.fromisoformat(ended_at['from'])
+    window_to = datetime.fromisoformat(ended_at['to'])
+
+    seen_ids = set()
+
+    def unique(orders):
+        result = []
+        for order in orders:
+            if order.id not in seen_ids:
+                seen_ids.add(order.id)
+                result.append(order)
+        return result
+
+    orders, cursor = fetch_cursor_page(url_path, park_id, api_key, client_id, data, 'заказов', parse_orders_page)
+    yield unique(orders)
+    if not cursor:
+        return
+
+    windows = split_orders_window(window_from, window_to, orders, limit)
+    if not windows:
+        # Дробить некуда - продолжаем по курсору
+        data['cursor'] = cursor
+        for page in iter_cursor_pages(url_path, park_id, api_key, client_id, data,
+                                      'orders', 'заказов', parse_orders_page):
+            yield unique(page)
+        return
+
+    def iter_window_pages(window):
+        window_data = get_orders_query(park_id, *window, limit=limit, whole_days=False)
+        return iter_cursor_pages(url_path, park_id, api_key, client_id, window_data,
+                                 'orders', 'заказов', parse_orders_page)
+
+    for page in iter_windows_pages(windows, iter_window_pages, concurrency):
+        yield unique(page)
+
+
+def iter_windows_pages(windows, iter_pages, concurrency=None):
+    """
+    Параллельная постраничная загрузка подпериодов: страницы отдаются по мере получения через
+    ограниченную очередь, поэтому подпериод не накапливается в памяти целиком.
+    Ошибка загрузки подпериода прерывает загрузку и передается вызывающему.
+    """
+    max_workers = min(concurrency or settings.FLEET_API_PAGES_CONCURRENCY, len(windows))
+    pages = queue.Queue(maxsize=max_workers * 2)
+    stop = threading.Event()
+    finished = object()
+
+    def produce(window):
+        try:
+            if stop.is_set():
+                return
+            for page in iter_pages(window):
+                if not put_until_stopped(pages, stop, page):
+                    return
+        except Exception as e:
+            put_until_stopped(pages, stop, e)
+        finally:
+            put_until_stopped(pages, stop, finished)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fleet-api-window') as executor:
+        for window in windows:
+            executor.submit(produce, window)
+
+        remaining = len(windows)
+        try:
+            while remaining:
+                page = pages.get()
+                if page is finished:
+                    remaining -= 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            stop.set()
+
+
+def post_orders_list(park_id, api_key, client_id, ended_at_from, ended_at_to):
+    """Получение списка заказов с экспоненциальной задержкой при ошибке 429"""
+    json_total = []
+    try:
+        for page in iter_orders_pages(park_id, api_key, client_id, ended_at_from, ended_at_to, parse=None):
+            json_total.extend(page)
+    except FleetApiError:
+        pass
 
     return {
         'orders': json_total
     }
 
 
-def post_park_transactions_list(park_id, api_key, client_id, orders_ids):
-    """Получение списка транзакций по заказу с экспоненциальной задержкой при ошибке 429"""
-    URL = URL_API_YANDEX + URL_API_POST_PARK_ORDERS_TRANSACTIONS_LIST
-
-    # заголовки
-    headers = get_headers(park_id, api_key, client_id)
-
+def iter_park_transactions_pages(park_id, api_key, client_id, orders_ids, parse=parse_transactions_page):
+    """Постраничная загрузка транзакций (TransactionRecord) по заказам с экспоненциальной задержкой при ошибке 429"""
     # формируем запрос
     limit = 500
 
@@ -293,95 +676,38 @@ def post_park_transactions_list(park_id, api_key, client_id, orders_ids):
             }
         }
     }
+    return iter_cursor_pages(
+        URL_API_POST_PARK_ORDERS_TRANSACTIONS_LIST,
+        park_id, api_key, client_id, data,
+        'transactions', 'транзакций', parse
+    )
 
-    def make_request():
-        nonlocal data, headers
-        delay = 30  # начальная задержка 30 секунд
-        max_attempts = 10  # максимальное количество попыток
-        attempt = 0
-
-        while attempt < max_attempts:
-            response = requests.request('POST', URL, headers=headers, json=data)
-            # print(response.text)
-
-            if response.status_code == 200:
-                return response
-            elif response.status_code == 429:
-                attempt += 1
-                logger.error(
-                    f'Ошибка 429 при запросе транзакций. Попытка {attempt}. Ждем {delay} сек. Park: {park_id}')
-                time.sleep(delay)
-                delay *= 2  # удваиваем задержку
-            else:
-                logger.error(
-                    f'Ошибка загрузки транзакций: {response.status_code} {response.text} Park: {park_id}')
-                return response
-
-        logger.error(
-            f'Превышено максимальное количество попыток ({max_attempts}) для транзакций заказа парк {park_id}')
-        return None
 
+def post_park_transactions_list(park_id, api_key, client_id, orders_ids):
+    """Получение списка транзакций по заказу с экспоненциальной задержкой при ошибке 429"""
     json_total = []
-    response = make_request()
-
-    if response and response.status_code == 200:
-        try:
-            json_total = response.json().get('transactions', [])
-
-            # Обработка курсора
-            while response.json().get('cursor'):
-
-                cursor = {'cursor': response.json().get('cursor')}
-                data.update(cursor)
-
-                response = make_request()
-                if response and response.status_code == 200:
-                    try:
-                        json_total.extend(response.json().get('transactions', []))
-                    except ValueError as e:
-                        print(f"Ошибка декодирования JSON для транзакций: {e}")
-                        print("Текст ответа:", response.text)
-                        logger.error(f'Ошибка декодирования JSON для транзакций: {e} {response.text} Order: {order_id}')
-                else:
-                    break
-        except Exception as e:
-            logger.error(f'Неожиданная ошибка при обработке транзакций: {e} Park: {park_id}')
+    try:
+        for page in iter_park_transactions_pages(park_id, api_key, client_id, orders_ids, parse=None):
+            json_total.extend(page)
+    except FleetApiError:
+        pass
 
     return {
-        'transactions': json_total if json_total is not None else []
+        'transactions': json_total
     }
 
 
 def get_transaction_categories(park_id, api_key, client_id):
     """Получение списка категорий транзакций"""
-    """Получение списка транзакций по водителю (курьеру)"""
-    URL = URL_API_YANDEX + URL_API_POST_TRANSACTIONS_CATEGORIES_LIST
-
-    headers = get_headers(park_id, api_key, client_id)
-
-    data = {
-        'query': {
-            'park': {
-                'id': park_id
-            }
-        }
-    }
-
-    response = requests.request('POST', URL, headers=headers, json=data)
-    if response.status_code == 200:
-        print(response.json())
-        return response.json()
-    return None
+    return post_transaction_categories_list(park_id, api_key, client_id)
 
 
 def get_driver_work_rules(park_id, api_key, client_id):
     """Получить список условий работы"""
-    URL = URL_API_YANDEX + URL_API_GET_WORK_RULES
+    url_path = URL_API_GET_WORK_RULES
 
-    # заголовки
-    headers = get_headers(park_id, api_key, client_id)
     params = {'park_id': park_id}
-    response = requests.request('GET', URL, headers=headers, params=params)
+    response = api_request('GET', url_path, park_id, api_key, client_id, params=params)
     if response.status_code == 200:
         return response.json()
     return None
@@ -389,43 +715,22 @@ def get_driver_work_rules(park_id, api_key, client_id):
 
 def post_car_list(park_id, api_key, client_id):
     """Получение списка автомобилей"""
-    URL = URL_API_YANDEX + URL_API_CARS_LIST_POST
-
-    # заголовки
-    headers = get_headers(park_id, api_key, client_id)
-
-    # получили общее количество
-    total = get_total(park_id, api_key, client_id, URL)
-    if not total:
-        return None
-    limit = 1000
-    offset = 0
-    count_pages = math.ceil(total / limit)
-
-    json_total = None
-    # для каждой страницы
-    for page in range(count_pages):
-        # количество автомобилей
-        count_cars = total - (page * limit)
-        if count_cars > limit:
-            count_cars = limit
-
-        data = {
-            'limit': limit,
-            'offset': offset,
-            'query': {
-                'park': {
-                    'id': park_id,
-                }
+    data = {
+        'query': {
+            'park': {
+                'id': park_id,
             }
         }
-        offset += count_cars
+    }
 
-        response = requests.request('POST', URL, headers=headers, json=data)
-        if response.status_code == 200:
-            if not json_total:
-                json_total = response.json()['cars']
-            json_total += response.json()['cars']
+    json_total = fetch_offset_pages(
+        URL_API_CARS_LIST_POST,
+        park_id, api_key, client_id, data,
+        'cars',
+        lambda item: item['id'],
+    )
+    if not json_total:
+        return None
 
     return {
         'cars': json_total
@@ -433,8 +738,18 @@ def post_car_list(park_id, api_key, client_id):
 
 
 def post_transaction_categories_list(park_id, api_key, client_id):
-    """Получение списка категорий транзакций"""
-    URL = URL_API_YANDEX + URL_API_POST_TRANSACTION_CATEGORIES_LIST
+    """Получение списка категорий транзакций (кэшируется)"""
+    data, _ = get_cached(
+        CACHE_TRANSACTION_CATEGORIES,
+        park_id,
+        lambda: fetch_transaction_categories_list(park_id, api_key, client_id)
+    )
+    return data
+
+
+def fetch_transaction_categories_list(park_id, api_key, client_id):
+    """Получение списка категорий транзакций из API"""
+    url_path = URL_API_POST_TRANSACTION_CATEGORIES_LIST
     data = {
         'query': {
             'park': {
@@ -442,9 +757,7 @@ def post_transaction_categories_list(park_id, api_key, client_id):
             }
         }
     }
-    # заголовки
-    headers = get_headers(park_id, api_key, client_id)
-    response = requests.request('POST', URL, headers=headers, json=data)
+    response = api_request('POST', url_path, park_id, api_key, client_id, json=data)
     if response.status_code == 200:
         return response.json()
-    return None
\ No newline at end of file
+    return None
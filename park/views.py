@@ -1,18 +1,26 @@
+import hmac
 import logging
 import time
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import zip_longest
 
 import pandas as pd
 from datetime import datetime, timedelta
 
 import pytz
-from dateutil import parser
+from django.conf import settings
 from django.db import transaction
-from django.http import HttpResponse
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, HttpResponseForbidden
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from rest_framework import status
 from rest_framework.response import Response
 
+from park.cache import CACHE_WORK_RULES, get_cached, is_applied, mark_applied
+from park.metrics import count_upserted, get_metrics, observe_transactions_backlog, track_loader
 from park.models import (
     Park,
     Driver,
@@ -21,33 +29,81 @@ from park.models import (
     Account,
     DriverWorkRule,
     Car,
-    DateProcessing,
+    ParkSyncState,
 )
 from park.utils import (
     get_profiles_list,
-    post_orders_list,
-    post_park_transactions_list, get_driver_work_rules, post_car_list, post_transaction_categories_list,
+    get_driver_work_rules,
+    post_car_list,
+    iter_parks_data,
+    iter_parks_pages,
+    iter_orders_pages,
+    iter_orders_pages_split,
+    iter_park_transactions_pages,
+    get_profile_updated_at,
 )
+from park.parsers import parse_date, parse_decimal
+from park.rollups import get_touched_days, refresh_orders_stats, refresh_transactions_stats
+from park.upsert import upsert
 
 logger = logging.getLogger(__name__)
 
 
-def load_work_rules(one_park_id=None):
+def get_active_parks(park_ids=None):
+    """Активные парки, все или заданные по park_id"""
+    qs = Park.objects.filter(is_active=True)
+    if park_ids:
+        qs = qs.filter(park_id__in=park_ids)
+    return qs
+
+
+def count_park_orders(**filters):
+    """
+    Число заказов парка с фильтром для annotate. Коррелированный подзапрос на каждый парк идет по индексу
+    заказов парка и отсекает секции по created_at, в отличие от соединения со всей таблицей заказов.
+    """
+    orders = Order.objects.filter(park=OuterRef('pk'), **filters).order_by().values('park')
+    return Coalesce(Subquery(orders.annotate(count=Count('pk')).values('count')), 0)
+
+
+def get_parks_by_size(park_ids=None):
+    """
+    park_id активных парков от малых к большим по числу заказов за последние сутки:
+    малые парки загружаются первыми и не ждут в очереди за большими
+    """
+    day_ago = timezone.now() - timedelta(days=1)
+    return list(
+        get_active_parks(park_ids)
+        .annotate(orders_count=count_park_orders(created_at__gte=day_ago))
+        .order_by('orders_count', 'pk')
+        .values_list('park_id', flat=True)
+    )
+
+
+@track_loader
+def load_work_rules(one_park_id=None, concurrency=None, park_ids=None):
     """Загрузить список условий работы"""
     batch_size = 100
     work_rules_to_create = []
 
-    qs = Park.objects.filter(is_active=True)
+    qs = get_active_parks(park_ids)
     # нужна выгрузка по конкретному парку
     if one_park_id:
         qs = qs.filter(park_id=one_park_id)
 
-    for park in qs:
-        client_id = park.client_id
-        api_key = park.api_key
-        park_id = park.park_id
+    def fetch(park):
+        # условия работы меняются редко - берем из кэша, пока не истек FLEET_API_CACHE_TTL
+        return get_cached(
+            CACHE_WORK_RULES,
+            park.park_id,
+            lambda: get_driver_work_rules(park.park_id, park.api_key, park.client_id)
+        )
 
-        data = get_driver_work_rules(park_id, api_key, client_id)
+    # запросы к API идут параллельно, запись в БД - последовательно по мере готовности парков
+    for park, (data, content_hash) in iter_parks_data(qs, fetch, concurrency):
+        # те же условия уже записаны в БД
+        if is_applied(CACHE_WORK_RULES, park.park_id, content_hash):
+            continue
 
         if data:
             for rule in data['rules']:
@@ -69,49 +125,78 @@ def load_work_rules(one_park_id=None):
                     unique_fields=['park', 'work_rule_id'],
                     update_fields=['is_enabled', 'name']
                 )
+                count_upserted(DriverWorkRule, work_rules_to_create)
                 work_rules_to_create = []  # Очищаем список для следующего парка
+                mark_applied(CACHE_WORK_RULES, park.park_id, content_hash)
 
     return HttpResponse("Успешно обновлен список условий работы", content_type="application/json; charset=utf-8")
 
 
-def load_yandex_driver_profiles():
+@track_loader
+def load_yandex_driver_profiles(concurrency=None, park_ids=None):
     """Загрузить список водителей Яндекс такси"""
-    batch_size = 100
-
-    qs = Park.objects.filter(is_active=True).prefetch_related('driver_park')
 
+    qs = get_active_parks(park_ids)
+    # строки, записанные в БД и пропущенные без изменений
+    written = skipped = 0
+
+    # Профили загружаются начиная с отметки прошлой синхронизации,
+    # раз в FLEET_API_PROFILES_FULL_SYNC_INTERVAL - полностью
+    now = timezone.now()
+    full_sync_interval = timedelta(seconds=settings.FLEET_API_PROFILES_FULL_SYNC_INTERVAL)
+    overlap = timedelta(seconds=settings.FLEET_API_SYNC_OVERLAP)
+    sync_states = {
+        state.park_id: state
+        for state in ParkSyncState.objects.filter(entity=ParkSyncState.ENTITY_DRIVERS, park__in=qs)
+    }
+    updated_since = {}
     for park in qs:
-        client_id = park.client_id
-        api_key = park.api_key
-        park_id = park.park_id
+        state = sync_states.get(park.pk)
+        if (
+            state and state.watermark and state.full_sync_at
+            and now - state.full_sync_at < full_sync_interval
+        ):
+            updated_since[park.pk] = state.watermark - overlap
+
+    # Условия работы загружаемых парков одним запросом: {park.pk: {work_rule_id: pk}}
+    work_rules_map = defaultdict(dict)
+    work_rules = DriverWorkRule.objects.filter(park__in=qs).values_list('park', 'work_rule_id', 'pk')
+    for park_pk, work_rule_id, work_rule_pk in work_rules:
+        work_rules_map[park_pk][work_rule_id] = work_rule_pk
+
+    def fetch(park):
+        return get_profiles_list(
+            park.park_id,
+            park.api_key,
+            park.client_id,
+            updated_since=updated_since.get(park.pk),
+        )
 
-        # ставим всем водителям статус уволен fired
-        data = get_profiles_list(park_id, api_key, client_id)
+    for park, data in iter_parks_data(qs, fetch, concurrency):
+        if data:
+            park_work_rules = work_rules_map[park.pk]
 
-        drivers_to_create = []
-        accounts_to_create = []
+            # Уникальные счета и водители: {account_id: Account}, {driver_id: (Driver, account_id)}
+            accounts = {}
+            drivers = {}
 
-        if data:
             for driver_data in data['driver_profiles']:
                 driver_profile = driver_data['driver_profile']
 
                 # извлекаем дату регистрации
-                created_date_str = driver_profile['created_date']
-                created_datetime = parser.parse(created_date_str)
-                created_date = created_datetime.date()
+                created_date = parse_date(driver_profile.get('created_date'))
 
                 work_rule = driver_profile.get('work_rule_id', '')
 
                 account_data = driver_data['accounts'][0]
-                account = Account(
-                    account_id=account_data['id'],
-                    balance=account_data['balance'],
-                    balance_limit=account_data.get('balance_limit', '0'),
+                account_id = account_data['id']
+                accounts.setdefault(account_id, Account(
+                    account_id=account_id,
+                    balance=parse_decimal(account_data.get('balance')),
+                    balance_limit=parse_decimal(account_data.get('balance_limit')),
                     currency=account_data['currency'],
                     account_type=account_data['type']
-                )
-
-                accounts_to_create.append(account)
+                ))
 
                 driver = Driver(
                     park=park,
@@ -120,11 +205,7 @@ def load_yandex_driver_profiles():
                     first_name=driver_profile.get('first_name', ''),
                     middle_name=driver_profile.get('middle_name', ''),
                     work_status=driver_profile['work_status'],
-                    work_rule=DriverWorkRule.objects.filter(
-                        park=park,
-                        work_rule_id=work_rule
-                    ).first() if work_rule else None,
-                    account=account,
+                    work_rule_id=park_work_rules.get(work_rule) if work_rule else None,
                     created_date=created_date
                 )
                 license = driver_profile.get('driver_license', None)
@@ -133,176 +214,267 @@ def load_yandex_driver_profiles():
                 if license is not None:
                     driver.driver_license_number = license.get('normalized_number', '')
                     driver.driver_license_country = license.get('country', '')
-                    driver.driver_license_issue_date = license.get('issue_date', None)
-                    driver.driver_license_expiration_date = license.get('expiration_date', None)
+                    driver.driver_license_issue_date = parse_date(license.get('issue_date'))
+                    driver.driver_license_expiration_date = parse_date(license.get('expiration_date'))
                 else:
                     # Явно устанавливаем None или пустые значения, если license отсутствует
                     driver.driver_license_number = ''
                     driver.driver_license_country = ''
-                    driver.issue_date = None
+                    driver.driver_license_issue_date = None
                     driver.driver_license_expiration_date = None
 
-                drivers_to_create.append(driver)
-
-            # Обрабатываем только уникальные водители
-            seen_account_ids = set()
-            filtered_accounts = []
-            for account in accounts_to_create:
-                if account.account_id not in seen_account_ids:
-                    filtered_accounts.append(account)
-                    seen_account_ids.add(account.account_id)
-
-            seen_driver_keys = set()
-            filtered_drivers = []
-            for driver in drivers_to_create:
-                key = (driver.park.id, driver.driver_id)
-                if key not in seen_driver_keys:
-                    filtered_drivers.append(driver)
-                    seen_driver_keys.add(key)
+                drivers.setdefault(driver.driver_id, (driver, account_id))
+
+            # driver_id уникален во всей базе: водителя, уже записанного за другим парком,
+            # пропускаем, иначе конфликт уронит запись всего парка
+            foreign_driver_ids = set(
+                Driver.objects.filter(driver_id__in=drivers.keys()).exclude(park=park)
+                .values_list('driver_id', flat=True)
+            )
+            if foreign_driver_ids:
+                logger.error(f"{park} Водители числятся за другим парком: {', '.join(sorted(foreign_driver_ids))}")
 
             try:
                 # Сначала создаем аккаунты
-                Account.objects.bulk_create(
-                    filtered_accounts,
-                    batch_size=batch_size,
-                    update_conflicts=True,
+                filtered_accounts, _ = upsert(
+                    Account,
+                    accounts.values(),
                     unique_fields=['account_id'],
                     update_fields=['balance', 'balance_limit']
                 )
+                count_upserted(Account, filtered_accounts)
+
+                # id счетов одним запросом
+                accounts_map = dict(
+                    Account.objects.filter(account_id__in=accounts.keys()).values_list('account_id', 'pk')
+                )
 
-                # Затем создаем водителей
-                Driver.objects.bulk_create(
+                filtered_drivers = []
+                for driver_id, (driver, account_id) in drivers.items():
+                    if driver_id in foreign_driver_ids:
+                        continue
+                    driver.account_id = accounts_map.get(account_id)
+                    filtered_drivers.append(driver)
+
+                # Затем создаем водителей, неизменившиеся профили не перезаписываются
+                written_drivers, skipped_drivers = upsert(
+                    Driver,
                     filtered_drivers,
-                    batch_size=batch_size,
-                    update_conflicts=True,
                     unique_fields=['park', 'driver_id'],
                     update_fields=[
                         'work_status', 'created_date', 'account', 'work_rule',
                         'driver_license_number', 'driver_license_country',
                         'driver_license_issue_date', 'driver_license_expiration_date'
-                    ]
+                    ],
+                    skip_unchanged=True
                 )
+                count_upserted(Driver, written_drivers, skipped_drivers)
+                written += len(written_drivers)
+                skipped += skipped_drivers
             except Exception as e:
                 logger.error(f"{park} Ошибка в обновлении списка водителей: %s", e)
+                continue
+
+            # Сдвигаем отметку только после успешной записи
+            updated_at = [
+                value for value in map(get_profile_updated_at, data['driver_profiles']) if value
+            ]
+            full_sync = park.pk not in updated_since
+            defaults = {}
+            if updated_at:
+                defaults['watermark'] = max(updated_at)
+            elif full_sync:
+                defaults['watermark'] = now
+            if full_sync:
+                defaults['full_sync_at'] = now
+            if defaults:
+                ParkSyncState.objects.update_or_create(
+                    park=park,
+                    entity=ParkSyncState.ENTITY_DRIVERS,
+                    defaults=defaults
+                )
 
-    return Response({'massage': 'Успешно обновлен список водителей'}, status=status.HTTP_200_OK)
+    logger.info(f'Водители: записано {written}, без изменений {skipped}')
+    return Response(
+        {'massage': 'Успешно обновлен список водителей', 'written': written, 'skipped': skipped},
+        status=status.HTTP_200_OK
+    )
 
 
-def load_order(ended_at_from=None, ended_at_to=None):
-    """Загрузка заказов"""
-    batch_size = 100  # Задайте желаемый размер пакета
+def write_orders_page(park, order_entries):
+    """Запись страницы заказов (OrderRecord) парка: возвращает (записано, без изменений)"""
+    # Получаем все уникальные driver_id
+    driver_ids = list({order.driver_id for order in order_entries if order.driver_id})
 
-    qs = Park.objects.filter(is_active=True)
+    # Разбиваем на части по 200
+    drivers_batch_size = 200
+    drivers_map = {}
 
-    for park in qs:
-        client_id = park.client_id
-        api_key = park.api_key
-        park_id = park.park_id
+    for i in range(0, len(driver_ids), drivers_batch_size):
+        batch = driver_ids[i:i + drivers_batch_size]
+        drivers_map.update(
+            {d.driver_id: d for d in Driver.objects.filter(driver_id__in=batch)}
+        )
 
-        if not ended_at_from or not ended_at_to:
-            # Получаем текущее время как объект datetime
-            now = datetime.now(pytz.timezone('Europe/Moscow'))
+    # 1. Собираем все car_id из заказов
+    car_ids = [order.car_id for order in order_entries if order.car_id]
 
-            # Устанавливаем ended_at_from как "сейчас минус 2 часа"
-            ended_at_from = now - timedelta(hours=2)
+    # 2. Получаем существующие автомобили одним запросом
+    # Создаем словарь {car_id: car_object} для быстрого поиска
+    existing_cars = {car.car_id: car for car in Car.objects.filter(car_id__in=car_ids)}
 
-            # Устанавливаем ended_at_to как "сейчас"
-            ended_at_to = now
-        else:
-            # Если даты заданы, парсим их и добавляем временную зону
-            if isinstance(ended_at_from, str):
-                ended_at_from = parse_datetime(ended_at_from).replace(tzinfo=pytz.timezone('Europe/Moscow'))
-            if isinstance(ended_at_to, str):
-                ended_at_to = parse_datetime(ended_at_to).replace(tzinfo=pytz.timezone('Europe/Moscow'))
-
-        data = post_orders_list(
-            park_id,
-            api_key,
-            client_id,
+    orders_to_create = []
+
+    for order_data in order_entries:
+        # Проверяем наличие водителя и машины в базе
+        driver = drivers_map.get(order_data.driver_id) if order_data.driver_id else None
+        car = existing_cars.get(order_data.car_id) if order_data.car_id else None
+
+        orders_to_create.append(Order(
+            park=park,
+            driver=driver,
+            order_id=order_data.id,
+            short_id=order_data.short_id,
+            category=order_data.category,
+            created_at=order_data.created_at,
+            status=order_data.status,
+            payment_method=order_data.payment_method,
+            price=order_data.price,
+            address_from=order_data.address_from,
+            address_from_lat=order_data.address_from_lat,
+            address_from_lon=order_data.address_from_lon,
+            address_to=order_data.address_to,
+            address_to_lat=order_data.address_to_lat,
+            address_to_lon=order_data.address_to_lon,
+            mileage=order_data.mileage,
+            car=car,
+            cancellation_description=order_data.cancellation_description
+        ))
+
+    # окно загрузки перекрывается с прошлым запуском, неизменившиеся заказы не перезаписываются.
+    # Итоги пересчитываются только за дни записанных заказов в той же транзакции: при ошибке пересчета
+    # откатываются и хеши заказов, и следующая загрузка запишет их и пересчитает итоги снова
+    with transaction.atomic():
+        orders_to_create, orders_skipped = upsert(
+            Order,
+            orders_to_create,
+            unique_fields=['created_at', 'order_id'],
+            update_fields=['status', 'price', 'short_id', 'category', 'mileage'],
+            skip_unchanged=True
+        )
+        refresh_orders_stats(get_touched_days(orders_to_create, 'created_at'))
+    count_upserted(Order, orders_to_create, orders_skipped)
+    return len(orders_to_create), orders_skipped
+
+
+def iter_park_orders_pages(park, ended_at_from, ended_at_to, whole_days=True):
+    """Страницы заказов парка за период"""
+    # для загруженных парков период делится на подпериоды, загружаемые параллельно
+    if settings.FLEET_API_ORDERS_SPLIT:
+        return iter_orders_pages_split(
+            park.park_id,
+            park.api_key,
+            park.client_id,
             ended_at_from,
             ended_at_to,
+            whole_days=whole_days,
         )
-        if not data or not data['orders']:
-            continue
+    return iter_orders_pages(
+        park.park_id,
+        park.api_key,
+        park.client_id,
+        ended_at_from,
+        ended_at_to,
+        whole_days=whole_days,
+    )
 
-        order_entries = data.get('orders', [])
 
-        # Получаем все уникальные driver_id
-        driver_ids = list({order['driver_profile']['id'] for order in order_entries})
+def load_park_orders(park, ended_at_from, ended_at_to):
+    """
+    Загрузка заказов одного парка за точный период в текущем потоке.
+    В отличие от load_order ошибки API и записи не перехватываются. Возвращает (записано, без изменений).
+    """
+    written = skipped = 0
+    for order_entries in iter_park_orders_pages(park, ended_at_from, ended_at_to, whole_days=False):
+        if order_entries:
+            orders_written, orders_skipped = write_orders_page(park, order_entries)
+            written += orders_written
+            skipped += orders_skipped
+    return written, skipped
 
-        # Разбиваем на части по 200
-        drivers_batch_size = 200
-        drivers_map = {}
 
-        for i in range(0, len(driver_ids), drivers_batch_size):
-            batch = driver_ids[i:i + drivers_batch_size]
-            drivers_map.update(
-                {d.driver_id: d for d in Driver.objects.filter(driver_id__in=batch)}
-            )
+@track_loader
+def load_order(ended_at_from=None, ended_at_to=None, concurrency=None, park_ids=None):
+    """Загрузка заказов"""
 
-        # 1. Собираем все car_id из заказов
-        car_ids = []
-        for order in data['orders']:
-            if isinstance(order, dict) and order.get('car'):
-                car_ids.append(order['car']['id'])
-
-        # 2. Получаем существующие автомобили одним запросом
-        # Создаем словарь {car_id: car_object} для быстрого поиска
-        existing_cars = {car.car_id: car for car in Car.objects.filter(car_id__in=car_ids)}
-
-        orders_to_create = []
-
-        for order_data in order_entries:
-            # Проверяем наличие водителя и машины в базе
-            driver = drivers_map.get(order_data['driver_profile']['id']) if order_data.get('driver_profile') else None
-            car = existing_cars.get(order_data['car']['id']) if order_data.get('car') else None
-
-            # Безопасное получение адреса назначения
-            route_points = order_data.get('route_points', [])
-            if route_points:  # Если есть точки маршрута
-                last_point = route_points[-1]
-                address_to = last_point['address']
-                address_to_lat = float(last_point['lat'])
-                address_to_lon = float(last_point['lon'])
-            else:  # Если точек маршрута нет
-                address_to = ''
-                address_to_lat = 0.0
-                address_to_lon = 0.0
-
-            orders_to_create.append(Order(
-                park=park,
-                driver=driver,
-                order_id=order_data['id'],
-                short_id=order_data['short_id'],
-                category=order_data.get('category', ''),
-                created_at=order_data['created_at'],
-                status=order_data['status'],
-                payment_method=order_data.get('payment_method', ''),
-                price=order_data.get('price', 0),
-                address_from=order_data['address_from']['address'],
-                address_from_lat=order_data['address_from']['lat'],
-                address_from_lon=order_data['address_from']['lon'],
-                address_to=address_to,
-                address_to_lat=address_to_lat,
-                address_to_lon=address_to_lon,
-                mileage=order_data.get('mileage', 0),
-                car=car,
-                cancellation_description=order_data.get('cancellation_description', '')
-            ))
-
-        if orders_to_create:
-            try:
-                Order.objects.bulk_create(
-                    orders_to_create,
-                    batch_size=batch_size,
-                    update_conflicts=True,
-                    unique_fields=['order_id'],
-                    update_fields=['status', 'price', 'short_id', 'category', 'mileage']
+    qs = get_active_parks(park_ids)
+    # строки, записанные в БД и пропущенные без изменений
+    written = skipped = 0
+
+    # период загрузки по паркам: {park.pk: (ended_at_from, ended_at_to)}
+    windows = {}
+    sync = not ended_at_from or not ended_at_to
+
+    if sync:
+        # Загружаем период с отметки прошлой успешной загрузки парка с небольшим перекрытием
+        now = datetime.now(pytz.timezone('Europe/Moscow'))
+        overlap = timedelta(seconds=settings.FLEET_API_SYNC_OVERLAP)
+        max_gap_from = now - timedelta(seconds=settings.FLEET_API_ORDERS_MAX_GAP)
+        sync_states = {
+            state.park_id: state
+            for state in ParkSyncState.objects.filter(entity=ParkSyncState.ENTITY_ORDERS, park__in=qs)
+        }
+        for park in qs:
+            state = sync_states.get(park.pk)
+            if state and state.watermark:
+                window_from = state.watermark - overlap
+                if window_from < max_gap_from:
+                    logger.warning(f'{park} Заказы не загружались с {state.watermark}, '
+                                   f'более ранние чем {max_gap_from} нужно дозагрузить за даты')
+                    window_from = max_gap_from
+            else:
+                window_from = now - timedelta(seconds=settings.FLEET_API_ORDERS_INITIAL_WINDOW)
+            windows[park.pk] = (window_from, now)
+    else:
+        # Если даты заданы, парсим их и добавляем временную зону
+        if isinstance(ended_at_from, str):
+            ended_at_from = parse_datetime(ended_at_from).replace(tzinfo=pytz.timezone('Europe/Moscow'))
+        if isinstance(ended_at_to, str):
+            ended_at_to = parse_datetime(ended_at_to).replace(tzinfo=pytz.timezone('Europe/Moscow'))
+        for park in qs:
+            windows[park.pk] = (ended_at_from, ended_at_to)
+
+    def iter_pages(park):
+        # по отметке синхронизации загружается точный период, заданные даты расширяются до целых суток
+        return iter_park_orders_pages(park, *windows[park.pk], whole_days=not sync)
+
+    # парки, у которых запись какой-либо страницы завершилась ошибкой
+    failed_parks = set()
+
+    # каждая страница пишется в БД сразу, пока следующие страницы еще загружаются
+    for park, order_entries in iter_parks_pages(qs, iter_pages, concurrency):
+        if order_entries is None:
+            # Все страницы парка загружены и записаны - сдвигаем отметку синхронизации
+            if sync and park not in failed_parks:
+                ParkSyncState.objects.update_or_create(
+                    park=park,
+                    entity=ParkSyncState.ENTITY_ORDERS,
+                    defaults={'watermark': windows[park.pk][1]}
                 )
-            except Exception as e:
-                logger.error("Ошибка в добавлении заказов: %s", e)
+            continue
+        if not order_entries:
+            continue
 
-    return Response({'massage': 'заказы загружены'}, status=status.HTTP_200_OK)
+        try:
+            orders_written, orders_skipped = write_orders_page(park, order_entries)
+            written += orders_written
+            skipped += orders_skipped
+        except Exception as e:
+            failed_parks.add(park)
+            logger.error("Ошибка в добавлении заказов: %s", e)
+
+    logger.info(f'Заказы: записано {written}, без изменений {skipped}')
+    return Response({'massage': 'заказы загружены', 'written': written, 'skipped': skipped}, status=status.HTTP_200_OK)
 
 
 def load_park_data_from_file():
@@ -328,23 +500,23 @@ def load_park_data_from_file():
         print(f"Park: {park}, Key: {key}, Client: {client}")
 
 
-def load_cars(park=None):
+@track_loader
+def load_cars(park=None, concurrency=None, park_ids=None):
     """Загрузить список автомобилей"""
-    batch_size = 100
 
-    qs = Park.objects.filter(is_active=True)
+    qs = get_active_parks(park_ids)
+    # строки, записанные в БД и пропущенные без изменений
+    written = skipped = 0
     # нужна выгрузка по конкретному парку
     if park:
         qs = qs.filter(profile__pk=park)
 
-    cars_to_create = []
+    def fetch(park_data):
+        return post_car_list(park_data.park_id, park_data.api_key, park_data.client_id)
 
-    for park_data in qs:
-        client_id = park_data.client_id
-        api_key = park_data.api_key
-        park_id = park_data.park_id
+    for park_data, data in iter_parks_data(qs, fetch, concurrency):
+        cars_to_create = []
 
-        data = post_car_list(park_id, api_key, client_id)
         if data and data['cars']:
             # Словарь для устранения дубликатов car_id
             unique_cars = {}
@@ -385,138 +557,188 @@ def load_cars(park=None):
             # Добавляем только уникальные машины
             cars_to_create.extend(unique_cars.values())
 
-        Car.objects.bulk_create(
+        cars_to_create, cars_skipped = upsert(
+            Car,
             cars_to_create,
-            batch_size=batch_size,
-            update_conflicts=True,
             unique_fields=['car_id'],
-            update_fields=['status']
+            update_fields=['status'],
+            skip_unchanged=True
         )
+        count_upserted(Car, cars_to_create, cars_skipped)
+        written += len(cars_to_create)
+        skipped += cars_skipped
+
+    logger.info(f'Автомобили: записано {written}, без изменений {skipped}')
 
     return HttpResponse("Успешно обновлен список водителей", content_type="application/json; charset=utf-8")
 
 
-def load_transactions():
-    """Загрузка транзакций для определения корректности периодических списаний"""
-    batch_size = 100
+@dataclass(frozen=True)
+class OrdersChunk:
+    """Часть заказов парка, транзакции которых запрашиваются одним списком"""
+    park: Park
+    number: int
 
-    qs = Park.objects.filter(is_active=True)
+    @property
+    def park_id(self):
+        return self.park.park_id
 
-    transactions_to_create = []
 
-    for park in qs:
-        client_id = park.client_id
-        api_key = park.api_key
-        park_id = park.park_id
-        print(park.name)
+def get_transactions_backlog(parks):
+    """Число заказов без загруженных транзакций по паркам parks: {park.pk: число}"""
+    return dict(
+        Order.objects.filter(load_transaction_complete=False, park__in=parks)
+        .order_by()
+        .values_list('park')
+        .annotate(Count('pk'))
+    )
+
 
-        # Предварительно выбираем активные заказы и формируем словарь по order_id
-        active_orders = Order.objects.filter(
+def get_pending_orders_chunks(parks, chunk_size, max_chunks=None, exclude=()):
+    """
+    Заказы без загруженных транзакций частями по chunk_size: {OrdersChunk: {order_id: заказ}}.
+    Без max_chunks выбираются все заказы, начиная со старых. Части разных парков чередуются,
+    чтобы большая очередь одного парка не задерживала остальные.
+    """
+    parks_chunks = []
+    for park in parks:
+        pending_orders = Order.objects.filter(
             load_transaction_complete=False,
             park=park,
-        ).select_related('driver').values('order_id', 'pk', 'driver_id')[:100]
-
-        # Словарь заказов по order_id
-        orders_dict = {order['order_id']: order for order in active_orders}
-
-        # Фильтруем только используемые заказы
-        orders_ids = list(orders_dict.keys())
+        ).values('order_id', 'pk', 'driver_id')
+        if max_chunks:
+            pending_orders = pending_orders[:chunk_size * max_chunks]
+        else:
+            pending_orders = pending_orders.order_by('pk')
 
-        if not orders_ids:
-            continue
+        orders = [order for order in pending_orders if order['pk'] not in exclude]
+        parks_chunks.append([
+            (OrdersChunk(park, i // chunk_size), {order['order_id']: order for order in orders[i:i + chunk_size]})
+            for i in range(0, len(orders), chunk_size)
+        ])
 
-        # Запрашиваем транзакции по фильтрованному списку заказов
-        data = post_park_transactions_list(
-            park_id,
-            api_key,
-            client_id,
-            orders_ids
-        )
+    return dict(chunk for chunks in zip_longest(*parks_chunks) for chunk in chunks if chunk)
 
-        if not data:
-            continue
 
-        transactions_entries = data.get('transactions', [])
-
-        if not transactions_entries:
-            # Ставим метку для выбранных заказов
-            Order.objects.filter(pk__in=[order['pk'] for order in orders_dict.values()]).update(
-                load_transaction_complete=True)
-
-        # Обрабатываем каждую транзакцию
-        for transaction_data in transactions_entries:
-            order_id = transaction_data['order_id']
-            order = orders_dict.get(order_id)
-
-            if not order:
-                continue  # пропускаем транзакцию, если соответствующего заказа нет
-
-            # Формируем новую транзакцию
-            transactions_to_create.append(Transaction(
-                park=park,
-                driver_id=order['driver_id'],  # Идентификатор водителя
-                order_id=order['pk'],  # Идентификатор заказа
-                transaction_id=transaction_data['id'],
-                event_at=transaction_data['event_at'],
-                category_id=transaction_data.get('category_id', ''),
-                category_name=transaction_data.get('category_name', ''),
-                group_id=transaction_data.get('group_id', ''),
-                amount=float(transaction_data.get('amount', 0)),
-                description=transaction_data.get('description', '')
-            ))
-
-        # Применяем массовые обновления
-        if transactions_to_create:
-            try:
-                Transaction.objects.bulk_create(
-                    transactions_to_create,
-                    batch_size=batch_size,
-                    update_conflicts=True,
-                    unique_fields=['transaction_id'],
-                    update_fields=['amount', 'group_id']
-                )
+@track_loader
+def load_transactions(concurrency=None, drain=False, time_budget=None, park_ids=None):
+    """
+    Загрузка транзакций для определения корректности периодических списаний.
+    За обычный запуск берется до 100 заказов парка. В режиме drain разбирается вся очередь заказов
+    частями по 100, пока она не опустеет или не истечет time_budget секунд.
+    """
+    chunk_size = 100
+
+    qs = list(get_active_parks(park_ids))
+    # строки, записанные в БД и пропущенные без изменений
+    written = skipped = 0
+
+    if drain:
+        deadline = time.monotonic() + (time_budget or settings.FLEET_API_TRANSACTIONS_DRAIN_TIME_BUDGET)
+    else:
+        deadline = None
+    # заказы, транзакции которых уже запрашивались в этом запуске: после ошибки повторяются в следующем
+    attempted = set()
+
+    while True:
+        chunks = get_pending_orders_chunks(qs, chunk_size, max_chunks=None if drain else 1, exclude=attempted)
+        if not chunks:
+            break
+        for orders_dict in chunks.values():
+            attempted.update(order['pk'] for order in orders_dict.values())
+
+        def iter_pages(chunk):
+            # Запрашиваем транзакции по фильтрованному списку заказов
+            return iter_park_transactions_pages(
+                chunk.park.park_id,
+                chunk.park.api_key,
+                chunk.park.client_id,
+                list(chunks[chunk].keys())
+            )
 
-                # Ставим метку для выбранных заказов
-                Order.objects.filter(pk__in=[order['pk'] for order in orders_dict.values()]).update(
-                    load_transaction_complete=True)
+        # части, у которых запись какой-либо страницы завершилась ошибкой
+        failed_chunks = set()
+        expired = False
 
-            except Exception as e:
-                logger.error("Ошибка в добавлении транзакций: %s", e)
+        # лимит запросов к API общий для всех воркеров, части разных парков загружаются параллельно
+        for chunk, transactions_entries in iter_parks_pages(chunks.keys(), iter_pages, concurrency):
+            if deadline and time.monotonic() > deadline:
+                # незавершенные части останутся в очереди до следующего запуска
+                expired = True
+                break
 
-    return Response({'message': 'транзакции загружены'}, status=status.HTTP_200_OK)
+            park = chunk.park
+            orders_dict = chunks[chunk]
 
+            if transactions_entries is None:
+                # Все страницы части загружены и записаны - ставим метку для ее заказов
+                if chunk not in failed_chunks:
+                    Order.objects.filter(pk__in=[order['pk'] for order in orders_dict.values()]).update(
+                        load_transaction_complete=True)
+                continue
 
-def process_dates_with_resume():
-    """
-    Обрабатывает даты с возможностью продолжения с последней успешной даты
-    """
-    start_date = datetime.strptime('2025-07-25', '%Y-%m-%d').date()
-    end_date = datetime.strptime('2025-08-30', '%Y-%m-%d').date()
+            transactions_to_create = []
 
-    # Получаем или создаем запись
-    processing_record, created = DateProcessing.objects.get_or_create(
-        defaults={'last_processed_date': start_date - timedelta(days=1)}
-    )
+            # Обрабатываем каждую транзакцию
+            for transaction_data in transactions_entries:
+                order = orders_dict.get(transaction_data.order_id)
 
-    current_date = processing_record.last_processed_date + timedelta(days=1)
+                if not order:
+                    continue  # пропускаем транзакцию, если соответствующего заказа нет
 
-    # Обрабатываем даты
-    while current_date <= end_date:
-        try:
-            # Основная логика обработки
-            load_order(
-                current_date.strftime('%Y-%m-%d'),
-                current_date.strftime('%Y-%m-%d')
-            )
+                # Формируем новую транзакцию
+                transactions_to_create.append(Transaction(
+                    park=park,
+                    driver_id=order['driver_id'],  # Идентификатор водителя
+                    order_id=order['pk'],  # Идентификатор заказа
+                    transaction_id=transaction_data.id,
+                    event_at=transaction_data.event_at,
+                    category_id=transaction_data.category_id,
+                    category_name=transaction_data.category_name,
+                    group_id=transaction_data.group_id,
+                    amount=transaction_data.amount,
+                    description=transaction_data.description
+                ))
+
+            # Применяем массовые обновления
+            if transactions_to_create:
+                try:
+                    # транзакции и итоги их дней записываются вместе
+                    with transaction.atomic():
+                        transactions_to_create, transactions_skipped = upsert(
+                            Transaction,
+                            transactions_to_create,
+                            unique_fields=['event_at', 'transaction_id'],
+                            update_fields=['amount', 'group_id'],
+                            skip_unchanged=True
+                        )
+                        refresh_transactions_stats(get_touched_days(transactions_to_create, 'event_at'))
+                    count_upserted(Transaction, transactions_to_create, transactions_skipped)
+                    written += len(transactions_to_create)
+                    skipped += transactions_skipped
+                except Exception as e:
+                    failed_chunks.add(chunk)
+                    logger.error("Ошибка в добавлении транзакций: %s", e)
+
+        # очередь пополняется новыми заказами, пока идет разбор - повторяем до пустой очереди
+        if not drain or expired:
+            break
 
-            # Обновляем последнюю дату
-            processing_record.last_processed_date = current_date
-            processing_record.save()
+    # задача парка считает и обновляет очередь только своих парков
+    backlog = get_transactions_backlog(qs)
+    observe_transactions_backlog({park.park_id: backlog.get(park.pk, 0) for park in qs})
 
-            logger.error(f"Успешно обработано: {current_date}")
+    logger.info(f'Транзакции: записано {written}, без изменений {skipped}, в очереди {sum(backlog.values())}')
+    return Response(
+        {'message': 'транзакции загружены', 'written': written, 'skipped': skipped},
+        status=status.HTTP_200_OK
+    )
 
-        except Exception as e:
-            logger.error(f"Ошибка при обработке даты {current_date}: {str(e)}")
-            break
 
-        current_date += timedelta(days=1)
+def metrics(request):
+    """Метрики загрузчиков и клиента Fleet API для Prometheus: только с токеном METRICS_TOKEN"""
+    token = settings.METRICS_TOKEN
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    content, content_type = get_metrics()
+    return HttpResponse(content, content_type=content_type)